@@ -1,12 +1,20 @@
 #!/usr/bin/env python3
 
+import argparse
 import collections
+import csv
+import difflib
 import glob
 import json
+import os
 import re
+import time
 import lxml
 from lxml.builder import E
+import numpy as np
+import xlrd
 import xlsxwriter
+from common import CLLABELS, file_hash, word_keys, words_hash
 
 def od(**x):
     return collections.OrderedDict([(("class" if a == "klass" else a), str(b)) for a,b in sorted(x.items())])
@@ -45,52 +53,7 @@ class Word:
     def finish(self):
         assert self.full != ''
         self.full = ' '.join(self.full.split())
-        x = self.full.lower()
-        x = {
-            'ye': 'the',
-            'he': 'the',
-            'hit': 'it',
-            'hyt': 'it',
-            'his': 'this',
-            'hem': 'them',
-            'fro': 'from',
-            'froo': 'from',
-            'yerof': 'thereof',
-        }.get(x, x)
-        x = re.sub(r'\s+', '', x)
-        x = re.sub(r'[?*/_.]', '', x)
-        x = re.sub(r'&', 'et', x)
-        x = re.sub(r'\+t', 'þ', x)
-        x = re.sub(r'\+3', 'ȝ', x)
-        x = re.sub(r'þ', 'th', x)
-        x = re.sub(r'^ȝ', 'gh', x)
-        x = re.sub(r'(?<=[aiouy])ȝ', 'gh', x)
-        x = re.sub(r'ȝ$', 'z', x)
-        x = re.sub(r'ȝ', 'y', x)
-        x = re.sub(r'ph', 'f', x)
-        x = re.sub(r'th|d', 't', x)
-        x = re.sub(r'[mn]', 'm', x)
-        x = re.sub(r'[zsk]', 'c', x)
-        x = re.sub(r'[jyea]', 'i', x)
-        x = re.sub(r'[vw]', 'u', x)
-        x = re.sub(r'([a-z])(?=\1)', '', x)
-        x = re.sub(r'i?ri?', 'r', x)
-        x = re.sub(r'cio', 'tio', x)
-        x = re.sub(r'^hour', 'our', x)
-        x = re.sub(r'(?<=..)i$', '', x)
-        x = re.sub(r'(?<=..)is$', 's', x)
-        self.norm = x
-        x = re.sub(r'[xc]', 't', x)
-        x = re.sub(r'[ou]', 'o', x)
-        x = re.sub(r'(?<=.)[io]', '', x)
-        x = re.sub(r'h', '', x)
-        x = re.sub(r'([a-z])(?=\1)', '', x)
-        x = {
-            'tflt': 'tft',
-        }.get(x, x)
-        if x == '':
-            x = '*'
-        self.weak = x
+        self.norm, self.weak = word_keys(self.full)
 
 
 class Chunk:
@@ -252,17 +215,347 @@ class Text:
             word.feed(child.tail)
 
 
-Match = collections.namedtuple('Match', 'ii limit weak')
+# classes: the annotators' values of the CLLABELS columns, kept when the
+# row is relocated.
+Match = collections.namedtuple('Match', 'ii limit weak fix classes', defaults=[None, None])
 
 class Num:
     def __init__(self, v=0):
         self.v = v
 
 
+METRICS = ['key', 'weak', 'limit', 'time', 'gaps', 'peeks', 'anchors', 'seen']
+
+def align_chunks(chunks, anchors=(), metrics=None):
+    n = len(chunks)
+    peeks = Num()
+    peak = Num()
+
+    def peek(j, i, limit, weak):
+        peeks.v += 1
+        w = ''
+        while True:
+            if i >= len(chunks[j].words):
+                return None
+            word = chunks[j].words[i]
+            w += word.weak if weak else word.norm
+            if len(w) >= limit:
+                return w
+            i += 1
+
+    def find_between(aa, bb, limit, weak):
+        o = 1
+        seen = collections.defaultdict(dict)
+        while True:
+            progress = False
+            for j in range(n):
+                if aa[j] + o >= bb[j]:
+                    continue
+                w = peek(j, aa[j] + o, limit, weak)
+                if w is None:
+                    continue
+                progress = True
+                if j not in seen[w]:
+                    seen[w][j] = o
+                    if len(seen[w]) == n:
+                        peak.v = max(peak.v, len(seen))
+                        return seen[w]
+            if not progress:
+                peak.v = max(peak.v, len(seen))
+                return None
+            o += 1
+
+    def refine(aa, bb, limit, weak):
+        new_matches = []
+        ii = aa
+        while True:
+            vv = find_between(ii, bb, limit, weak)
+            if vv is None:
+                break
+            ii = [ii[j] + vv[j] for j in range(n)]
+            new_matches.append(Match(ii, limit, weak))
+        return new_matches
+
+    ff = [ -1 for j in range(n) ]
+    nn = [ len(chunks[j].words) for j in range(n) ]
+
+    matches = [Match(ff, None, None)] + list(anchors) + [Match(nn, None, None)]
+
+    for weak in [False, True]:
+        rg = range(2,40) if weak else range(1,40)
+        for limit in reversed(rg):
+            t0 = time.perf_counter()
+            peeks.v = 0
+            peak.v = 0
+            new_matches = [matches[0]]
+            for mi in range(1, len(matches)):
+                aa = matches[mi-1]
+                bb = matches[mi]
+                new_matches.extend(refine(aa.ii, bb.ii, limit, weak))
+                new_matches.append(bb)
+            if metrics is not None:
+                metrics.append({
+                    'weak': weak,
+                    'limit': limit,
+                    'time': time.perf_counter() - t0,
+                    'gaps': len(matches) - 1,
+                    'peeks': peeks.v,
+                    'anchors': len(new_matches) - len(matches),
+                    'seen': peak.v,
+                })
+            matches = new_matches
+
+    matches.pop(0)
+    matches.pop()
+    return matches
+
+
+def relocate(old, new):
+    # Map old word indices to new word indices, based on the full forms.
+    sm = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    m = {}
+    for a, b, size in sm.get_matching_blocks():
+        for i in range(size):
+            m[a + i] = b + i
+    return m
+
+
+class Page:
+    # Writes an HTML page that consists of one table, one row at a time,
+    # without building the document tree of the whole table.
+    def __init__(self, f, title):
+        doc = E.html({"lang": "en"},
+            E.head(
+                E.title(title),
+                E.link(od(rel="stylesheet", href="style.css", type="text/css")),
+                E.meta(od(charset="UTF-8")),
+                E.meta(od(name="viewport", content="width=device-width, initial-scale=1")),
+            ),
+            E.body(
+                E.div(od(id="wrap"),
+                    E.table(),
+                )
+            ),
+        )
+        head, tail = lxml.etree.tostring(doc, method='html', encoding=str).split('<table></table>')
+        self.f = f
+        self.f.write('<!DOCTYPE html>\n')
+        self.f.write(head + '<table>')
+        self.tail = '</table>' + tail
+
+    def row(self, r, attr=None):
+        r2 = []
+        for j,x in enumerate(r):
+            if j:
+                r2.append(E.td(od(klass="pad"), ""))
+            r2.append(x)
+        if attr is None:
+            tr = E.tr(*r2)
+        else:
+            tr = E.tr(attr, *r2)
+        self.f.write(lxml.etree.tostring(tr, method='html', encoding=str))
+
+    def close(self):
+        self.f.write(self.tail)
+        self.f.write('\n')
+
+
+def write_index(f, texts, keys):
+    page = Page(f, "John of Burgundy")
+
+    def add_row(r, kl=None, link=None):
+        attr = collections.OrderedDict()
+        if kl is not None:
+            attr["class"] = kl
+        if link is not None:
+            attr["onclick"] = "window.open('{}');".format(link)
+        page.row(r, attr)
+
+    add_row([E.td(label) for label in texts], "head")
+
+    prev = '1'
+    for key, k in keys.items():
+        r = [E.td(x) for x in k['orig']]
+        link = "{}.html".format(key)
+        if prev != key[0]:
+            prev = key[0]
+            add_row(r, "sep hover", link=link)
+        else:
+            add_row(r, "hover", link=link)
+
+    page.close()
+
+
+def word_cell(w):
+    kl = "abbr" if w.abbr else "normal"
+    return(E.td(od(klass=kl, title="{} {}".format(w.norm, w.weak)), w.full))
+
+class Html:
+    # Writes output/<key>.html as the rows are produced, or all pages
+    # to the given file object.
+    def __init__(self, f=None):
+        self.out = f
+
+    def start(self, key, name, labels):
+        if self.out is None:
+            self.f = open('output/{}.html'.format(key), 'w')
+        else:
+            self.f = self.out
+        self.page = Page(self.f, name)
+        self.page.row([E.td(l) for l in labels], od(klass="head"))
+
+    def gap(self, r):
+        tds = []
+        for x in r:
+            if x is None:
+                tds.append(E.td(od(klass="empty"), ''))
+            else:
+                tds.append(word_cell(x[1]))
+        self.page.row(tds, od(klass="gap"))
+
+    def match(self, mm, r):
+        self.page.row([word_cell(w) for i, w in r], od(klass="match"))
+
+    def finish(self):
+        self.page.close()
+        if self.out is None:
+            self.f.close()
+
+    def close(self):
+        pass
+
+
+class Workbook:
+    # Writes one worksheet per key, row by row, so that in the
+    # constant-memory mode only the current row is kept in memory.
+    # With explain=True, the normalised forms are shown next to each word,
+    # and with classes=True (realigning with anchors), the class columns
+    # of the annotated workbook follow the score and fix columns.
+    def __init__(self, filename, explain=False, classes=False):
+        self.wb = xlsxwriter.Workbook(filename, {'constant_memory': True})
+        self.explain = explain
+        self.classes = classes
+        self.w = 4 if explain else 2
+        red, blue, black = '#ff0000', '#0000ff', '#000000'
+        self.head = self.wb.add_format({'bold': True})
+        self.head_right = self.wb.add_format({'bold': True, 'align': 'right'})
+        self.gap_word = [self.wb.add_format({'color': red, 'bold': abbr}) for abbr in [False, True]]
+        self.match_word = [self.wb.add_format({'color': blue if abbr else black, 'bold': abbr}) for abbr in [False, True]]
+        self.score = [self.wb.add_format({'color': col}) for col in [black, red]]
+
+    def start(self, key, name, labels):
+        n = len(labels)
+        w = self.w
+        self.n = n
+        self.ws = self.wb.add_worksheet(name)
+        for j,x in enumerate(labels):
+            self.ws.set_column(w*j, w*j, 5)
+            self.ws.set_column(w*j+1, w*j+1, 16)
+            self.ws.write_string(0, w*j, '#', self.head_right)
+            self.ws.write_string(0, w*j + 1, x, self.head)
+        self.ws.set_column(w*n, w*n+1, 8)
+        self.ws.write_string(0, w*n, 'score', self.head_right)
+        self.ws.write_string(0, w*n+1, 'fix', self.head_right)
+        if self.classes:
+            for i,x in enumerate(CLLABELS):
+                self.ws.write_string(0, w*n+2+i, x, self.head)
+        self.row = 1
+
+    def words(self, r, formats):
+        w = self.w
+        for j,x in enumerate(r):
+            if x is not None:
+                i, word = x
+                self.ws.write_number(self.row, w*j, i)
+                self.ws.write_string(self.row, w*j + 1, word.full, formats[word.abbr])
+                if self.explain:
+                    self.ws.write_string(self.row, w*j + 2, word.norm)
+                    self.ws.write_string(self.row, w*j + 3, word.weak)
+
+    def gap(self, r):
+        self.words(r, self.gap_word)
+        self.row += 1
+
+    def match(self, mm, r):
+        c = self.w * self.n
+        self.words(r, self.match_word)
+        if mm.limit is not None:
+            bad = mm.weak or mm.limit < 10
+            self.ws.write_number(self.row, c, mm.limit + (0 if mm.weak else 50), self.score[bad])
+        if mm.fix is not None:
+            self.ws.write_number(self.row, c+1, mm.fix)
+        if mm.classes is not None:
+            for i,x in enumerate(mm.classes):
+                if x != '':
+                    self.ws.write(self.row, c+2+i, x)
+        self.row += 1
+
+    def finish(self):
+        pass
+
+    def close(self):
+        self.wb.close()
+
+
+class Rows:
+    # Writes every word of every row to output/rows/<key>.csv, one line
+    # per word, for analysis with tools that do not read Excel files.
+    def __init__(self, dirname):
+        self.dirname = dirname
+        os.makedirs(dirname, exist_ok=True)
+        for filename in glob.glob(os.path.join(dirname, '*.csv')):
+            os.remove(filename)
+
+    def start(self, key, name, labels):
+        self.key = key
+        self.labels = labels
+        self.row = 0
+        self.f = open(os.path.join(self.dirname, '{}.csv'.format(key)), 'w', newline='')
+        self.out = csv.writer(self.f)
+        self.out.writerow(['key', 'row', 'kind', 'witness', 'index', 'full', 'norm', 'weak', 'abbr', 'limit', 'weak_match', 'fix'])
+
+    def words(self, kind, r, mm=None):
+        self.row += 1
+        if mm is None:
+            extra = ['', '', '']
+        else:
+            extra = [
+                '' if mm.limit is None else mm.limit,
+                '' if mm.weak is None else int(mm.weak),
+                '' if mm.fix is None else mm.fix,
+            ]
+        for j,x in enumerate(r):
+            if x is not None:
+                i, w = x
+                self.out.writerow([self.key, self.row, kind, self.labels[j], i, w.full, w.norm, w.weak, int(w.abbr)] + extra)
+
+    def gap(self, r):
+        self.words('gap', r)
+
+    def match(self, mm, r):
+        self.words('match', r, mm)
+
+    def finish(self):
+        self.f.close()
+
+    def close(self):
+        pass
+
+
+# Each sink is made with a flag that tells if we are realigning with anchors.
+SINKS = {
+    'workbook': lambda anchored: Workbook('output/jburgundy.xlsx', classes=anchored),
+    'explain': lambda anchored: Workbook('output/jburgundy-explain.xlsx', explain=True, classes=anchored),
+    'html': lambda anchored: Html(),
+    'rows': lambda anchored: Rows('output/rows'),
+}
+
 class Align:
-    def __init__(self):
+    def __init__(self, anchors=None, sinks=('workbook', 'rows', 'html')):
         self.text_map = {}
         self.texts = []
+        self.anchors = anchors
+        self.sink_names = sinks
 
     def feed(self, label, filename):
         assert label not in self.texts
@@ -270,7 +563,14 @@ class Align:
         self.text_map[label] = text
         self.texts.append(text)
 
-    def process(self):
+    def feed_all(self):
+        for filename in sorted(glob.glob('data/*.xml')):
+            m = re.fullmatch(r'data/(.*)_DSH_final\.xml', filename)
+            assert m
+            label = m.group(1)
+            self.feed(label, filename)
+
+    def find_names(self):
         self.names = {}
         for text in self.texts:
             for chunk in text.chunks:
@@ -278,79 +578,143 @@ class Align:
                     assert self.names[chunk.key] == chunk.name
                 else:
                     self.names[chunk.key] = chunk.name
-        self.index()
+
+    def witnesses(self, key):
+        labels = []
+        chunks = []
+        for text in self.texts:
+            if key in text.chunk_map:
+                labels.append(text.label)
+                chunks.append(text.chunk_map[key])
+        return labels, chunks
+
+    def process(self):
+        self.find_names()
+        if 'html' in self.sink_names:
+            self.index()
+        self.book = None
+        if self.anchors is not None:
+            self.book = xlrd.open_workbook(self.anchors)
         self.summary = collections.Counter()
-        self.wb = xlsxwriter.Workbook('output/jburgundy.xlsx')
-        self.formats = {}
+        self.metrics = []
+        self.sinks = [SINKS[x](self.book is not None) for x in self.sink_names]
+        if 'rows' in self.sink_names:
+            self.write_keys()
+        self.write_manifest()
         for key in sorted(self.names.keys()):
             self.align(key)
         self.write_summary()
-        self.wb.close()
-
-    def fmt(self, ff):
-        if len(ff) == 0:
-            return None
-        z = {}
-        for f in ff:
-            z.update(f)
-        t = tuple(sorted(z.items()))
-        if t not in self.formats:
-            format = self.wb.add_format(z)
-            self.formats[t] = format
-        return self.formats[t]
+        self.write_metrics()
+        for sink in self.sinks:
+            sink.close()
+
+    def key_table(self):
+        # For each key, its name, the texts that contain it, and the
+        # original label of the chunk in each text ('' if missing).
+        keys = collections.OrderedDict()
+        for key in sorted(self.names.keys()):
+            labels, chunks = self.witnesses(key)
+            orig = [text.chunk_map[key].orig if key in text.chunk_map else '' for text in self.texts]
+            keys[key] = {'name': self.names[key], 'texts': labels, 'orig': orig}
+        return keys
 
     def index(self):
-        tablerows = []
-
-        def add_row(r, kl=None, link=None):
-            r2 = []
-            for j,x in enumerate(r):
-                if j:
-                    r2.append(E.td(od(klass="pad"), ""))
-                r2.append(x)
-            attr = collections.OrderedDict()
-            if kl is not None:
-                attr["class"] = kl
-            if link is not None:
-                attr["onclick"] = "window.open('{}');".format(link)
-            tablerows.append(E.tr(attr, *r2))
-
-        add_row([E.td(text.label) for text in self.texts], "head")
-
-        prev = '1'
-        for key in sorted(self.names.keys()):
-            r = []
-            link = "{}.html".format(key)
-            for text in self.texts:
-                if key in text.chunk_map:
-                    r.append(E.td(text.chunk_map[key].orig))
+        with open('output/index.html', 'w') as f:
+            write_index(f, [text.label for text in self.texts], self.key_table())
+
+    def write_keys(self):
+        dump = {
+            'texts': [ text.label for text in self.texts ],
+            'keys': self.key_table(),
+        }
+        with open('output/rows/keys.json', 'w') as f:
+            json.dump(dump, f, indent=1)
+
+    def read_anchors(self, key, labels, chunks):
+        # Returns the anchors, and the classes of the other aligned rows
+        # of the old sheet, keyed by their relocated word indices.
+        if self.book is None or self.names[key] not in self.book.sheet_names():
+            return [], {}
+        sheet = self.book.sheet_by_name(self.names[key])
+        n = len(chunks)
+        head = sheet.row_values(0)
+        if head[1:2*n:2] != labels or head[2*n:2*n+2] != ['score', 'fix']:
+            print('anchors: witnesses changed, realigning everything')
+            return [], {}
+        cscore = 2*n
+        cfix = cscore + 1
+        ccl = cfix + 1
+        ncl = len(CLLABELS)
+        has_classes = head[ccl:ccl+ncl] == CLLABELS
+        old = [{} for j in range(n)]
+        fixed = []
+        classified = []
+        for r in range(1, sheet.nrows):
+            idx = []
+            for j in range(n):
+                v = sheet.cell(r, 2*j).value
+                if v == '':
+                    idx.append(None)
                 else:
-                    r.append(E.td(""))
-            if prev != key[0]:
-                prev = key[0]
-                add_row(r, "sep hover", link=link)
+                    v = int(v)
+                    old[j][v] = sheet.cell(r, 2*j+1).value
+                    idx.append(v)
+            classes = None
+            if has_classes:
+                values = sheet.row_values(r)
+                classes = values[ccl:ccl+ncl] + [''] * (ccl + ncl - len(values))
+                if all(x == '' for x in classes):
+                    classes = None
+            fix = sheet.cell(r, cfix).value
+            if fix != '':
+                assert fix in (0, 1), (self.names[key], r+1)
+                assert None not in idx, (self.names[key], r+1)
+                fixed.append((idx, int(fix), sheet.cell(r, cscore).value, classes))
+            elif classes is not None and None not in idx:
+                classified.append((idx, classes))
+        maps = []
+        for j in range(n):
+            words = [old[j][i] for i in sorted(old[j])]
+            maps.append(relocate(words, [w.full for w in chunks[j].words]))
+        anchors = []
+        prev = [-1 for j in range(n)]
+        for idx, fix, score, classes in fixed:
+            ii = [maps[j].get(idx[j]) for j in range(n)]
+            if None in ii or any(ii[j] <= prev[j] for j in range(n)):
+                continue
+            if fix == 1:
+                anchors.append(Match(ii, None, None, fix, classes))
             else:
-                add_row(r, "hover", link=link)
-
-        doc = E.html({"lang": "en"},
-            E.head(
-                E.title("John of Burgundy"),
-                E.link(od(rel="stylesheet", href="style.css", type="text/css")),
-                E.meta(od(charset="UTF-8")),
-                E.meta(od(name="viewport", content="width=device-width, initial-scale=1")),
-            ),
-            E.body(
-                E.div(od(id="wrap"),
-                    E.table(*tablerows),
-                )
-            ),
-        )
-
-        filename = 'output/index.html'
-        with open(filename, 'w') as f:
-            f.write('<!DOCTYPE html>\n')
-            f.write(lxml.etree.tostring(doc, method='html', encoding=str))
-            f.write('\n')
+                score = int(score)
+                weak = score < 50
+                anchors.append(Match(ii, score if weak else score - 50, weak, fix, classes))
+            prev = ii
+        print('anchors: {} of {} kept'.format(len(anchors), len(fixed)))
+        kept = {}
+        for idx, classes in classified:
+            ii = [maps[j].get(idx[j]) for j in range(n)]
+            if None not in ii:
+                kept[tuple(ii)] = classes
+        return anchors, kept
+
+    def write_manifest(self):
+        # What the sheets of this alignment were made from; extract.py
+        # checks the XML files and its own parse of them against this.
+        keys = collections.OrderedDict()
+        for key in sorted(self.names.keys()):
+            labels, chunks = self.witnesses(key)
+            keys[key] = {
+                'name': self.names[key],
+                'texts': labels,
+                'words': [len(c.words) for c in chunks],
+                'sha256': [words_hash(c.words) for c in chunks],
+            }
+        dump = {
+            'texts': [{'label': text.label, 'filename': text.filename, 'sha256': file_hash(text.filename)} for text in self.texts],
+            'keys': keys,
+        }
+        with open('output/manifest.json', 'w') as f:
+            json.dump(dump, f, indent=1)
 
     def write_summary(self):
         dump = {
@@ -359,80 +723,61 @@ class Align:
         }
         with open('output/summary.json', 'w') as f:
             json.dump(dump, f, sort_keys=True, indent=1)
+        # The same counts with each pattern coded as a base-3 number:
+        # digit j is 0 or 1 for text j, or 2 if the key is missing in it.
+        digit = {'0': 0, '1': 1, 'N': 2}
+        patterns = sorted(self.summary.keys())
+        codes = [sum(digit[x] * 3**j for j,x in enumerate(p)) for p in patterns]
+        np.savez_compressed('output/summary.npz',
+            texts=np.array(dump['texts']),
+            codes=np.array(codes, dtype=np.int64),
+            counts=np.array([self.summary[p] for p in patterns], dtype=np.int64),
+        )
  
+    def write_metrics(self):
+        keys = collections.OrderedDict()
+        for p in self.metrics:
+            if p['key'] not in keys:
+                keys[p['key']] = {'time': 0.0, 'gaps': 0, 'peeks': 0, 'anchors': 0, 'seen': 0}
+            k = keys[p['key']]
+            for x in ['time', 'gaps', 'peeks', 'anchors']:
+                k[x] += p[x]
+            k['seen'] = max(k['seen'], p['seen'])
+        total = sum(k['time'] for k in keys.values())
+        dump = {
+            'passes': self.metrics,
+            'keys': keys,
+            'time': total,
+        }
+        with open('output/metrics.json', 'w') as f:
+            json.dump(dump, f, sort_keys=True, indent=1)
+        with open('output/metrics.csv', 'w', newline='') as f:
+            w = csv.DictWriter(f, METRICS)
+            w.writeheader()
+            w.writerows(self.metrics)
+        print('alignment time {:.3f}s'.format(total))
+        for key in sorted(keys, key=lambda x: -keys[x]['time'])[:5]:
+            k = keys[key]
+            print('{:5s} {:8.3f}s {:9d} peeks, peak {} seen'.format(key, k['time'], k['peeks'], k['seen']))
+
     def align(self, key):
         print(key, self.names[key])
-        labels = []
-        chunks = []
-        for text in self.texts:
-            if key in text.chunk_map:
-                labels.append(text.label)
-                chunks.append(text.chunk_map[key])
+        labels, chunks = self.witnesses(key)
         n = len(chunks)
 
-        def peek(j, i, limit, weak):
-            w = ''
-            while True:
-                if i >= len(chunks[j].words):
-                    return None
-                word = chunks[j].words[i]
-                w += word.weak if weak else word.norm
-                if len(w) >= limit:
-                    return w
-                i += 1
-
-        def find_between(aa, bb, limit, weak):
-            o = 1
-            seen = collections.defaultdict(dict)
-            while True:
-                progress = False
-                for j in range(n):
-                    if aa[j] + o >= bb[j]:
-                        continue
-                    w = peek(j, aa[j] + o, limit, weak)
-                    if w is None:
-                        continue
-                    progress = True
-                    if j not in seen[w]:
-                        seen[w][j] = o
-                        if len(seen[w]) == n:
-                            return seen[w]
-                if not progress:
-                    return None
-                o += 1
-
-        def refine(aa, bb, limit, weak):
-            new_matches = []
-            ii = aa
-            while True:
-                vv = find_between(ii, bb, limit, weak)
-                if vv is None:
-                    break
-                ii = [ii[j] + vv[j] for j in range(n)]
-                new_matches.append(Match(ii, limit, weak))
-            return new_matches
-
-        ff = [ -1 for j in range(n) ]
         nn = [ len(chunks[j].words) for j in range(n) ]
-
-        matches = [Match(ff, None, None), Match(nn, None, None)]
-
-        for weak in [False, True]:
-            rg = range(2,40) if weak else range(1,40)
-            for limit in reversed(rg):
-                new_matches = [matches[0]]
-                for mi in range(1, len(matches)):
-                    aa = matches[mi-1]
-                    bb = matches[mi]
-                    new_matches.extend(refine(aa.ii, bb.ii, limit, weak))
-                    new_matches.append(bb)
-                matches = new_matches
-                print(limit, len(matches))
-
-        matches.pop(0)
-        matches.pop()
+        passes = []
+        anchors, classes = self.read_anchors(key, labels, chunks)
+        matches = align_chunks(chunks, anchors, passes)
+        # A row that is aligned as before keeps its classes.
+        matches = [mm._replace(classes=classes[tuple(mm.ii)]) if mm.classes is None and tuple(mm.ii) in classes else mm for mm in matches]
+        for p in passes:
+            p['key'] = key
+        self.metrics.extend(passes)
 
         for mm in matches:
+            if mm.fix == 0:
+                continue
             ma = ''
             j = 0
             for text in self.texts:
@@ -444,107 +789,59 @@ class Align:
                     ma += 'N'
             self.summary[ma] += 1
 
-        tablerows = []
-        ws = self.wb.add_worksheet(self.names[key])
-        wsr = Num(0)
-
-        def add_row(r, kl=None):
-            r2 = []
-            for j,x in enumerate(r):
-                if j:
-                    r2.append(E.td(od(klass="pad"), ""))
-                r2.append(x)
-            if kl is None:
-                tablerows.append(E.tr(*r2))
-            else:
-                tablerows.append(E.tr(od(klass=kl), *r2))
-
-        add_row([E.td(l) for l in labels], "head")
-        for j,x in enumerate(labels):
-            ws.set_column(2*j, 2*j, 5)
-            ws.set_column(2*j+1, 2*j+1, 16)
-            ws.write_string(wsr.v, 2*j, '#', self.fmt([{'bold':True}, {'align': 'right'}]))
-            ws.write_string(wsr.v, 2*j + 1, x, self.fmt([{'bold':True}]))
-        ws.set_column(2*n, 2*n+1, 8)
-        ws.write_string(wsr.v, 2*n, 'score', self.fmt([{'bold':True}, {'align': 'right'}]))
-        ws.write_string(wsr.v, 2*n+1, 'fix', self.fmt([{'bold':True}, {'align': 'right'}]))
-        wsr.v += 1
+        for sink in self.sinks:
+            sink.start(key, self.names[key], labels)
 
         ii = [ 0 for j in range(n) ]
 
-        def word_cell(w):
-            kl = "abbr" if w.abbr else "normal"
-            return(E.td(od(klass=kl, title="{} {}".format(w.norm, w.weak)), w.full))
-
         def add_gap(mm):
             while True:
-                r = []
+                cells = []
                 seen = False
                 for j,c in enumerate(chunks):
                     if ii[j] < mm.ii[j]:
-                        w = c.words[ii[j]]
-                        r.append(word_cell(w))
-                        col = {'color': '#ff0000'}
-                        ws.write_number(wsr.v, 2*j, ii[j])
-                        ws.write_string(wsr.v, 2*j + 1, w.full, self.fmt([col, {'bold': w.abbr}]))
+                        cells.append((ii[j], c.words[ii[j]]))
                         ii[j] += 1
                         seen = True
                     else:
-                        r.append(E.td(od(klass="empty"), ''))
+                        cells.append(None)
                 if not seen:
                     return
-                add_row(r, "gap")
-                wsr.v += 1
+                for sink in self.sinks:
+                    sink.gap(cells)
 
         def add_match(mm):
-            r = []
+            cells = []
             for j,c in enumerate(chunks):
                 assert ii[j] == mm.ii[j]
-                w = c.words[ii[j]]
-                r.append(word_cell(w))
-                col = {'color': '#0000ff' if w.abbr else '#000000'}
-                ws.write_number(wsr.v, 2*j, ii[j])
-                ws.write_string(wsr.v, 2*j + 1, w.full, self.fmt([col, {'bold': w.abbr}]))
+                cells.append((ii[j], c.words[ii[j]]))
                 ii[j] += 1
-            add_row(r, "match")
-            col = {'color': '#ff0000' if mm.weak or mm.limit < 10 else '#000000'}
-            ws.write_number(wsr.v, 2*n, mm.limit + (0 if mm.weak else 50), self.fmt([col]))
-            wsr.v += 1
+            for sink in self.sinks:
+                sink.match(mm, cells)
 
         for mm in matches:
             add_gap(mm)
             add_match(mm)
         add_gap(Match(nn, None, None))
-
-        doc = E.html({"lang": "en"},
-            E.head(
-                E.title(self.names[key]),
-                E.link(od(rel="stylesheet", href="style.css", type="text/css")),
-                E.meta(od(charset="UTF-8")),
-                E.meta(od(name="viewport", content="width=device-width, initial-scale=1")),
-            ),
-            E.body(
-                E.div(od(id="wrap"),
-                    E.table(*tablerows),
-                )
-            ),
-        )
-
-        filename = 'output/{}.html'.format(key)
-        with open(filename, 'w') as f:
-            f.write('<!DOCTYPE html>\n')
-            f.write(lxml.etree.tostring(doc, method='html', encoding=str))
-            f.write('\n')
+        for sink in self.sinks:
+            sink.finish()
         print()
 
 
 def main():
-    align = Align()
-    for filename in sorted(glob.glob('data/*.xml')):
-        m = re.fullmatch(r'data/(.*)_DSH_final\.xml', filename)
-        assert m
-        label = m.group(1)
-        align.feed(label, filename)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--anchors', metavar='XLSX',
+        help='annotated workbook; rows with fix 0 or 1 are kept as they are, and only the regions between them are realigned')
+    parser.add_argument('--sinks', default='workbook,rows,html',
+        help='comma-separated outputs to produce in one alignment pass, out of: ' + ', '.join(SINKS))
+    args = parser.parse_args()
+    sinks = args.sinks.split(',')
+    for x in sinks:
+        if x not in SINKS:
+            parser.error('unknown sink: ' + x)
+    align = Align(args.anchors, sinks)
+    align.feed_all()
     align.process()
 
-main()
+if __name__ == '__main__':
+    main()
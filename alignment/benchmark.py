@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+import argparse
+import csv
+import json
+import time
+import xlrd
+from align import Align, align_chunks
+import synthetic
+
+ENGINES = {
+    'align': lambda chunks: align_chunks(chunks),
+}
+
+def gold_matches(sheet, labels):
+    # The rows that extract.py accepts as aligned, as tuples of word indices.
+    n = len(labels)
+    head = sheet.row_values(0)
+    if head[1:2*n:2] != labels:
+        return None
+    gold = set()
+    for r in range(1, sheet.nrows):
+        v = sheet.row_values(r)
+        score, fix = v[2*n], v[2*n+1]
+        if fix == 1 or (fix == '' and score != ''):
+            gold.add(tuple(int(v[2*j]) for j in range(n)))
+    return gold
+
+
+class Score:
+    def __init__(self):
+        self.found = 0
+        self.gold = 0
+        self.hits = 0
+        self.time = 0.0
+
+    def add(self, other):
+        self.found += other.found
+        self.gold += other.gold
+        self.hits += other.hits
+        self.time += other.time
+
+    def dump(self):
+        return {
+            'found': self.found,
+            'gold': self.gold,
+            'hits': self.hits,
+            'precision': self.hits / self.found if self.found else None,
+            'recall': self.hits / self.gold if self.gold else None,
+            'time': self.time,
+        }
+
+    def show(self, label):
+        d = self.dump()
+        p = '-' if d['precision'] is None else '{:.4f}'.format(d['precision'])
+        r = '-' if d['recall'] is None else '{:.4f}'.format(d['recall'])
+        print('{:24s} {:>8s} {:>8s} {:6d} {:6d} {:9.3f}s'.format(label, p, r, self.found, self.gold, self.time))
+
+
+def timed(engine, chunks, repeat):
+    best = None
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        matches = ENGINES[engine](chunks)
+        t = time.perf_counter() - t0
+        best = t if best is None else min(best, t)
+    return matches, best
+
+def evaluate(engine, chunks, gold, repeat):
+    score = Score()
+    matches, score.time = timed(engine, chunks, repeat)
+    found = set(tuple(mm.ii) for mm in matches)
+    score.found = len(found)
+    score.gold = len(gold)
+    score.hits = len(found & gold)
+    return score
+
+
+def run(align, book, engines, repeat):
+    result = {}
+    for engine in engines:
+        total = Score()
+        per_key = {}
+        for key in sorted(align.names.keys()):
+            labels, chunks = align.witnesses(key)
+            if len(chunks) < 2 or align.names[key] not in book.sheet_names():
+                continue
+            gold = gold_matches(book.sheet_by_name(align.names[key]), labels)
+            if gold is None:
+                print('{}: witnesses differ from the workbook, skipped'.format(key))
+                continue
+            score = evaluate(engine, chunks, gold, repeat)
+            score.show('{} {}'.format(engine, key))
+            per_key[key] = score.dump()
+            total.add(score)
+        total.show('{} total'.format(engine))
+        print()
+        result[engine] = {'keys': per_key, 'total': total.dump()}
+    return result
+
+
+def scaling(base, engines, ns, lengths, repeat):
+    result = []
+    for engine in engines:
+        for n in ns:
+            for length in lengths:
+                chunks, gold = synthetic.witnesses(base, n, length)
+                score = evaluate(engine, chunks, gold, repeat)
+                score.show('{} n={} len={}'.format(engine, n, length))
+                r = {'engine': engine, 'witnesses': n, 'length': length}
+                r.update(score.dump())
+                result.append(r)
+        print()
+    with open('output/scaling.json', 'w') as f:
+        json.dump(result, f, sort_keys=True, indent=1)
+    with open('output/scaling.csv', 'w', newline='') as f:
+        w = csv.DictWriter(f, ['engine', 'witnesses', 'length', 'found', 'gold', 'hits', 'precision', 'recall', 'time'])
+        w.writeheader()
+        w.writerows(result)
+
+
+def numbers(x):
+    return [int(a) for a in x.split(',')]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workbook', default='data/jburgundy.xlsx',
+        help='annotated workbook with the manually corrected alignment')
+    parser.add_argument('--engine', action='append', choices=sorted(ENGINES),
+        help='aligner to evaluate (default: all)')
+    parser.add_argument('--repeat', type=int, default=1,
+        help='run each alignment this many times and report the fastest')
+    parser.add_argument('--synthetic', action='store_true',
+        help='align synthetic witnesses of growing number and length instead')
+    parser.add_argument('--base', metavar='FILE',
+        help='plain text file for the synthetic witnesses (default: the words of the first XML file)')
+    parser.add_argument('--witnesses', type=numbers, default='2,3,4,6,8,12',
+        help='comma-separated numbers of synthetic witnesses')
+    parser.add_argument('--lengths', type=numbers, default='250,500,1000,2000,4000',
+        help='comma-separated lengths of the synthetic texts, in words')
+    args = parser.parse_args()
+    engines = args.engine or sorted(ENGINES)
+    if args.synthetic and args.base is not None:
+        with open(args.base) as f:
+            base = f.read().split()
+    else:
+        align = Align()
+        align.feed_all()
+        align.find_names()
+        base = [w.full.lower() for c in align.texts[0].chunks for w in c.words]
+    print('{:24s} {:>8s} {:>8s} {:>6s} {:>6s} {:>10s}'.format('', 'prec', 'recall', 'found', 'gold', 'time'))
+    if args.synthetic:
+        scaling(base, engines, args.witnesses, args.lengths, args.repeat)
+        return
+    book = xlrd.open_workbook(args.workbook)
+    result = run(align, book, engines, args.repeat)
+    with open('output/benchmark.json', 'w') as f:
+        json.dump(result, f, sort_keys=True, indent=1)
+
+main()
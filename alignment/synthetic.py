@@ -0,0 +1,67 @@
+import random
+import re
+from align import Chunk, Word
+
+# Spelling variation of the kind that Word.finish normalises away.
+VARIANTS = [
+    (r'th', 'þ'),
+    (r'þ', 'th'),
+    (r'y', 'i'),
+    (r'i', 'y'),
+    (r'gh', 'ȝ'),
+    (r'^y', 'ȝ'),
+    (r'([bcdfglmnprst])', r'\1\1'),
+    (r'([a-z])\1', r'\1'),
+]
+
+def vary(form, rng):
+    pattern, repl = rng.choice(VARIANTS)
+    found = list(re.finditer(pattern, form))
+    if not found:
+        return form
+    m = rng.choice(found)
+    return form[:m.start()] + m.expand(repl) + form[m.end():]
+
+def make_word(form, abbr):
+    word = Word()
+    word.feed(form)
+    word.abbr = abbr
+    word.finish()
+    return word
+
+def base_text(base, length):
+    return [base[i % len(base)] for i in range(length)]
+
+def witness(text, rng, variation, insert, delete, abbr):
+    words = []
+    origin = []
+    for i, form in enumerate(text):
+        if rng.random() >= delete:
+            if rng.random() < variation:
+                form = vary(form, rng)
+            words.append(make_word(form, rng.random() < abbr))
+            origin.append(i)
+        if rng.random() < insert:
+            words.append(make_word(rng.choice(text), rng.random() < abbr))
+            origin.append(None)
+    return words, origin
+
+def witnesses(base, n, length, seed=0, variation=0.2, insert=0.02, delete=0.02, abbr=0.15):
+    # Returns n chunks derived from the same text, and the correct
+    # alignment as a set of tuples of word indices.
+    text = base_text(base, length)
+    chunks = []
+    where = []
+    for j in range(n):
+        rng = random.Random('{} {} {} {}'.format(seed, n, length, j))
+        words, origin = witness(text, rng, variation, insert, delete, abbr)
+        chunk = Chunk('Synthetic', str(j))
+        chunk.words = words
+        chunk.wc = len(words)
+        chunks.append(chunk)
+        where.append({x: i for i, x in enumerate(origin) if x is not None})
+    gold = set()
+    for x in range(length):
+        if all(x in w for w in where):
+            gold.add(tuple(w[x] for w in where))
+    return chunks, gold
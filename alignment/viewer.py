@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import argparse
+import csv
+import functools
+import http.server
+import io
+import json
+import os
+from align import Html, Word, write_index
+
+def read_rows(filename, labels):
+    # Rows of output/rows/<key>.csv as (kind, [(index, word) or None]).
+    col = {label: j for j,label in enumerate(labels)}
+    kind = None
+    prev = None
+    r = None
+    with open(filename, newline='') as f:
+        for x in csv.DictReader(f):
+            if x['row'] != prev:
+                if r is not None:
+                    yield kind, r
+                prev = x['row']
+                kind = x['kind']
+                r = [None for label in labels]
+            w = Word()
+            w.full = x['full']
+            w.norm = x['norm']
+            w.weak = x['weak']
+            w.abbr = x['abbr'] == '1'
+            r[col[x['witness']]] = (int(x['index']), w)
+    if r is not None:
+        yield kind, r
+
+
+class Viewer:
+    # Renders the pages that align.py would write, from the files in
+    # output/rows, the first time each of them is requested.
+    def __init__(self, dirname):
+        self.dirname = dirname
+        with open(os.path.join(dirname, 'rows', 'keys.json')) as f:
+            self.meta = json.load(f)
+        self.cache = {}
+
+    def index(self):
+        f = io.StringIO()
+        write_index(f, self.meta['texts'], self.meta['keys'])
+        return f.getvalue()
+
+    def key(self, key):
+        k = self.meta['keys'][key]
+        f = io.StringIO()
+        html = Html(f)
+        html.start(key, k['name'], k['texts'])
+        for kind, r in read_rows(os.path.join(self.dirname, 'rows', '{}.csv'.format(key)), k['texts']):
+            if kind == 'gap':
+                html.gap(r)
+            else:
+                html.match(None, r)
+        html.finish()
+        return f.getvalue()
+
+    def page(self, path):
+        name = path.lstrip('/') or 'index.html'
+        if name not in self.cache:
+            if name == 'index.html':
+                self.cache[name] = self.index()
+            elif name.endswith('.html') and name[:-5] in self.meta['keys']:
+                self.cache[name] = self.key(name[:-5])
+            else:
+                return None
+        return self.cache[name]
+
+
+class Handler(http.server.SimpleHTTPRequestHandler):
+    def __init__(self, *args, viewer, **kwargs):
+        self.viewer = viewer
+        super().__init__(*args, directory=viewer.dirname, **kwargs)
+
+    def do_GET(self):
+        page = self.viewer.page(self.path.split('?')[0])
+        if page is None:
+            return super().do_GET()
+        body = page.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+    viewer = Viewer('output')
+    handler = functools.partial(Handler, viewer=viewer)
+    server = http.server.ThreadingHTTPServer(('localhost', args.port), handler)
+    print('http://localhost:{}/'.format(args.port))
+    server.serve_forever()
+
+main()
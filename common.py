@@ -0,0 +1,70 @@
+import hashlib
+import json
+import re
+
+# The class columns that follow the score and fix columns in the
+# annotated sheets.
+CLLABELS  = ['A lex-funct', 'B numeral?', 'C measurement?', 'D Three syllables?', 'E Per']
+
+def file_hash(filename):
+    with open(filename, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def words_hash(words):
+    # The same for the words of align.py and extract.py: the full forms
+    # are normalised as in fix_word of extract.py.
+    h = hashlib.sha256()
+    for w in words:
+        full = ' '.join(w.full.split()).replace('+t', 'þ')
+        h.update(json.dumps([full, w.abbr]).encode('utf-8'))
+    return h.hexdigest()
+
+def word_keys(x):
+    # The norm and weak keys of a word: the normalised forms that align.py
+    # compares, strictly and loosely, and freq.py --fuzzy clusters by.
+    x = ' '.join(x.split()).lower()
+    x = {
+        'ye': 'the',
+        'he': 'the',
+        'hit': 'it',
+        'hyt': 'it',
+        'his': 'this',
+        'hem': 'them',
+        'fro': 'from',
+        'froo': 'from',
+        'yerof': 'thereof',
+    }.get(x, x)
+    x = re.sub(r'\s+', '', x)
+    x = re.sub(r'[?*/_.]', '', x)
+    x = re.sub(r'&', 'et', x)
+    x = re.sub(r'\+t', 'þ', x)
+    x = re.sub(r'\+3', 'ȝ', x)
+    x = re.sub(r'þ', 'th', x)
+    x = re.sub(r'^ȝ', 'gh', x)
+    x = re.sub(r'(?<=[aiouy])ȝ', 'gh', x)
+    x = re.sub(r'ȝ$', 'z', x)
+    x = re.sub(r'ȝ', 'y', x)
+    x = re.sub(r'ph', 'f', x)
+    x = re.sub(r'th|d', 't', x)
+    x = re.sub(r'[mn]', 'm', x)
+    x = re.sub(r'[zsk]', 'c', x)
+    x = re.sub(r'[jyea]', 'i', x)
+    x = re.sub(r'[vw]', 'u', x)
+    x = re.sub(r'([a-z])(?=\1)', '', x)
+    x = re.sub(r'i?ri?', 'r', x)
+    x = re.sub(r'cio', 'tio', x)
+    x = re.sub(r'^hour', 'our', x)
+    x = re.sub(r'(?<=..)i$', '', x)
+    x = re.sub(r'(?<=..)is$', 's', x)
+    norm = x
+    x = re.sub(r'[xc]', 't', x)
+    x = re.sub(r'[ou]', 'o', x)
+    x = re.sub(r'(?<=.)[io]', '', x)
+    x = re.sub(r'h', '', x)
+    x = re.sub(r'([a-z])(?=\1)', '', x)
+    x = {
+        'tflt': 'tft',
+    }.get(x, x)
+    if x == '':
+        x = '*'
+    return norm, x
@@ -1,9 +1,8 @@
 #!/usr/bin/env python3
 
 import collections
-import itertools
-import json
 import math
+from patterns import Patterns
 
 FULL_ONLY = True
 
@@ -31,15 +30,10 @@ def get_comp(comps, e):
 
 
 class Stat:
-    def __init__(self, dump):
-        self.texts = dump["texts"]
-        self.abbr_raw = dump["abbr"]
+    def __init__(self, patterns):
+        self.patterns = patterns
+        self.texts = patterns.texts
         self.n = len(self.texts)
-        self.abbr = {}
-        self.cases = sorted([x for x in itertools.product([0,1], repeat=self.n) if sum(x)])
-        for v in self.cases:
-            vs = ''.join([str(x) for x in v])
-            self.abbr[v] = self.abbr_raw.get(vs, 0)
 
     def process(self):
         self.count_pairs()
@@ -65,25 +59,24 @@ class Stat:
 
     def count_pairs(self):
         n = self.n
+        mask = self.patterns.some()
+        if FULL_ONLY:
+            mask &= self.patterns.full()
+        pairs = self.patterns.pairs(mask)
         self.pair = {}
         for i in range(n):
             for j in range(n):
                 if i == j:
                     continue
                 count = collections.Counter()
-                if FULL_ONLY:
-                    for v,c in self.abbr.items():
-                        count[(v[i],v[j])] += c
-                else:
-                    for v,c in self.abbr_raw.items():
-                        if v[i] in '01' and v[j] in '01' and '1' in v:
-                            count[(int(v[i]),int(v[j]))] += c
+                for a in [0,1]:
+                    for b in [0,1]:
+                        count[(a,b)] = int(pairs[i,j,a,b])
                 self.pair[(i,j)] = Table(count)
 
 
 def main():
-    with open('output/summary.json') as f:
-        stat = Stat(json.load(f))
+    stat = Stat(Patterns('output/summary.npz'))
     stat.process()
 
 main()
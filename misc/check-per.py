@@ -2,7 +2,7 @@
 
 from collections import Counter, defaultdict
 import itertools
-import json
+from parsing.records import read_jsonl
 
 ALL_TEXTS = [
     "Sloane2320",
@@ -14,23 +14,19 @@ ALL_TEXTS = [
 ]
 
 def main():
-    with open("output/extract2.json") as f:
-        data = json.load(f)
-
     texts = ALL_TEXTS[:-1]
     what = ["yes"]
     cases = defaultdict(list)
     print("texts = " + " ".join(texts))
     print("per = {}".format("/".join(what)))
     print()
-    for chunk in data:
-        textmap = { x: i for i,x in enumerate(chunk["texts"]) }
-        clmap = { x: i for i,x in enumerate(chunk["classes"]) }
-        for row,cl,words,short in chunk["rows"]:
-            if cl[clmap["per"]] not in what:
-                continue
-            case = " ".join( ({0:"-", 1:"+"}[row[textmap[x]]] if x in textmap else "?") for x in texts )
-            cases[case].append(words)
+    for record in read_jsonl("output/extract2.jsonl"):
+        if record["classes"]["per"] not in what:
+            continue
+        textmap = { x: i for i,x in enumerate(record["texts"]) }
+        row = record["abbr"]
+        case = " ".join( ({0:"-", 1:"+"}[row[textmap[x]]] if x in textmap else "?") for x in texts )
+        cases[case].append(record["words"])
     total = 0
     for case in sorted(cases.keys(), key=lambda x: (-len(cases[x]), x)):
         n = len(cases[case])
@@ -4,6 +4,7 @@ from collections import defaultdict, Counter, OrderedDict
 import json
 import lxml
 from lxml.builder import E
+from parsing.records import read_jsonl
 
 ALL_TEXTS = [
     "Sloane2320",
@@ -100,44 +101,21 @@ def write_html(filename, title, body):
 
 
 class Similarity:
+    # The rows of one (language, lex-funct) partition, and its clusters
+    # of spelling variants as computed by freq.py.
     def __init__(self):
-        self.p = {}
         self.raw = []
 
     def feed_row(self, d):
         self.raw.append(d)
-        l = get_norm_words(d)
-        for a in range(len(l)):
-            for b in range(a, len(l)):
-                self.merge(l[a], l[b])
-
-    def merge(self, a, b):
-        self.add(a)
-        self.add(b)
-        ra = self.get(a)
-        rb = self.get(b)
-        k = [ra, rb]
-        k.sort()
-        self.p[k[1]] = k[0]
-
-    def add(self, a):
-        if a not in self.p:
-            self.p[a] = a
+
+    def load_clusters(self, part):
+        self.names = [ c['name'] for c in part['clusters'] ]
+        self.ids = part['forms']
+        self.comp = { c['name']: c['forms'] for c in part['clusters'] }
 
     def get(self, a):
-        if self.p[a] == a:
-            return a
-        else:
-            x = self.get(self.p[a])
-            self.p[a] = x
-            return x
-
-    def form_clusters(self):
-        self.comp = defaultdict(list)
-        aa = sorted(self.p.keys())
-        for a in aa:
-            x = self.get(a)
-            self.comp[x].append(a)
+        return self.names[self.ids[a]]
 
     def row_to_cluster(self):
         self.rows = []
@@ -232,33 +210,34 @@ class Similarity:
         write_html(filename, title, doc)
 
     def analyze(self, filekey):
-        self.form_clusters()
         self.row_to_cluster()
         self.statistics()
         self.summarize(filekey)
 
 
 def main():
-    with open('output/extract.json') as f:
-        data = json.load(f)
+    with open('output/clusters.json') as f:
+        clusters = json.load(f)
 
     sim = defaultdict(Similarity)
 
-    for chunk in data:
-        language = chunk['language']
-        textmap = { x: i for i,x in enumerate(chunk['texts']) }
-        clmap = { x: i for i,x in enumerate(chunk['classes']) }
-        for row,cl,words in chunk['rows']:
-            funclex = cl[clmap['lex-funct']]
-            d = []
-            for text in ALL_TEXTS:
-                if text in textmap:
-                    i = textmap[text]
-                    d.append((row[i], words[i]))
-                else:
-                    d.append((None, None))
-            sim[(language,funclex)].feed_row(d)
+    for record in read_jsonl('output/extract.jsonl'):
+        language = record['language']
+        textmap = { x: i for i,x in enumerate(record['texts']) }
+        funclex = record['classes']['lex-funct']
+        d = []
+        for text in ALL_TEXTS:
+            if text in textmap:
+                i = textmap[text]
+                d.append((record['abbr'][i], record['words'][i]))
+            else:
+                d.append((None, None))
+        sim[(language,funclex)].feed_row(d)
 
+    for part in clusters:
+        k = (part['language'], part['lex-funct'])
+        if k in sim:
+            sim[k].load_clusters(part)
     for k in sorted(sim.keys()):
         sim[k].analyze(k)
 
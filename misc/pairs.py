@@ -1,9 +1,10 @@
 #!/usr/bin/env pypy3
 
-from collections import defaultdict, Counter, OrderedDict
-import json
+from collections import Counter, OrderedDict
 import lxml
 from lxml.builder import E
+import numpy as np
+from parsing.columnar import Columns
 
 ALL_TEXTS = [
     "Sloane2320",
@@ -148,12 +149,12 @@ def get_level(v, l1, l2):
     else:
         return 'nn'
 
-class Table0:
-    def __init__(self):
-        self.n = 0
+# Each table is made of the abbreviations of the selected rows, one
+# column per text (0, 1 or 2 texts).
 
-    def add(self):
-        self.n += 1
+class Table0:
+    def __init__(self, vv):
+        self.n = len(vv)
 
     def html(self):
         kl = "count"
@@ -162,13 +163,9 @@ class Table0:
         ]
 
 class Table1:
-    def __init__(self):
-        self.c = [0,0]
-        self.n = 0
-
-    def add(self, v1):
-        self.c[v1] += 1
-        self.n += 1
+    def __init__(self, vv):
+        self.c = np.bincount(vv[:,0], minlength=2).tolist()
+        self.n = len(vv)
 
     def html(self):
         c = self.c[1]
@@ -190,17 +187,12 @@ class Table1:
         ]
 
 class Table2:
-    def __init__(self):
-        self.c = [[0,0],[0,0]]
-        self.c1 = [0,0]
-        self.c2 = [0,0]
-        self.n = 0
-
-    def add(self, v1, v2):
-        self.c[v1][v2] += 1
-        self.c1[v1] += 1
-        self.c2[v2] += 1
-        self.n += 1
+    def __init__(self, vv):
+        c = np.bincount(2 * vv[:,0] + vv[:,1], minlength=4).reshape(2, 2)
+        self.c = c.tolist()
+        self.c1 = c.sum(axis=1).tolist()
+        self.c2 = c.sum(axis=0).tolist()
+        self.n = len(vv)
 
     def html(self):
         if self.n == 0:
@@ -254,51 +246,41 @@ def add_header(tablerows):
     tablerows.append(E.tr(od(klass="header"), *row))
 
 
-def process(texts, data, limiter, tablerows):
-    print(' '.join(texts))
-
-    ll = len(texts)
-    counters = defaultdict([Table0, Table1, Table2][ll])
-
-    for chunk in data:
-
-        textmap = { x: i for i,x in enumerate(chunk['texts']) }
-        clmap = { x: i for i,x in enumerate(chunk['classes']) }
+def class_masks(data):
+    # For each class in WHAT, the rows that belong to it.
+    y = data.column('lex-funct')
+    assert np.all(np.isin(y, ['func', 'lex']))
+    values = [y, data.column('language')]
+    for x in ['numeral', 'measurement', 'three syllables']:
+        y = data.column(x)
+        assert np.all(np.isin(y, ['yes', 'no', '']))
+        values.append(np.where(y == 'yes', x, np.where(y == 'no', 'not ' + x, '')))
+    y = data.column('kind')
+    values.append(np.where(np.isin(y, ['incipit', 'explicit']), 'incipit-explicit', y))
+    names = { x for what in WHAT for x in what }
+    return { x: np.any([v == x for v in values], axis=0) for x in names }
 
-        assert textmap.keys() <= set(ALL_TEXTS)
-        if not (set(texts) <= textmap.keys()):
-            continue
 
-        for row,cl,words in chunk['rows']:
-            vv = [ row[textmap[x]] for x in texts ]
-
-            if not limiter(cl[clmap['freq']], cl[clmap['sometimes']] == 'yes'):
-                continue
-
-            classes = set()
-            y = cl[clmap['lex-funct']]
-            assert y in ['func', 'lex']
-            classes.add(y)
-
-            for x in ['numeral', 'measurement', 'three syllables']:
-                y = cl[clmap[x]]
-                assert y in ['yes', 'no', '']
-                if y == 'yes':
-                    classes.add(x)
-                elif y == 'no':
-                    classes.add('not ' + x)
-
-            y = chunk['kind']
-            if y in ['incipit', 'explicit']:
-                y = 'incipit-explicit'
-            classes.add(y)
+def process(texts, data, classes, selected, tablerows):
+    print(' '.join(texts))
 
-            classes.add(chunk['language'])
+    ll = len(texts)
+    Table = [Table0, Table1, Table2][ll]
 
-            for what in WHAT:
-                if set(what) <= classes:
-                    counters[what].add(*vv)
+    if set(texts) <= set(data.texts):
+        cols = [ data.texts.index(x) for x in texts ]
+        vv = data.abbr[:, cols].astype(np.int64)
+        keep = selected & np.all(data.present[:, cols], axis=1)
+    else:
+        vv = np.zeros((data.rows, ll), dtype=np.int64)
+        keep = np.zeros(data.rows, dtype=bool)
 
+    counters = {}
+    for what in WHAT:
+        rows = keep.copy()
+        for x in what:
+            rows &= classes[x]
+        counters[what] = Table(vv[rows])
 
     row = [E.td(x) for x in texts]
     if ll == 0:
@@ -314,35 +296,38 @@ def process(texts, data, limiter, tablerows):
     tablerows.append(E.tr(*row))
 
 
-def limit(data, filekey, limiter):
+def limit(data, classes, filekey, limiter):
     n = len(ALL_TEXTS)
+    selected = limiter(data.column('freq'), data.column('sometimes') == 'yes')
+    selected = np.broadcast_to(selected, (data.rows,))
     tablerows = []
     add_header(tablerows)
     tablerows.append(E.tr(od(klass="pad lineunder"), E.td(od(colspan=str(2 + 3*len(WHAT))))))
     tablerows.append(E.tr(od(klass="pad")))
-    process([], data, limiter, tablerows)
+    process([], data, classes, selected, tablerows)
     for i in range(n):
         tablerows.append(E.tr(od(klass="pad")))
-        process([ALL_TEXTS[i]], data, limiter, tablerows)
+        process([ALL_TEXTS[i]], data, classes, selected, tablerows)
         tablerows.append(E.tr(od(klass="pad")))
         for j in range(n):
             if j != i:
-                process([ALL_TEXTS[i], ALL_TEXTS[j]], data, limiter, tablerows)
+                process([ALL_TEXTS[i], ALL_TEXTS[j]], data, classes, selected, tablerows)
     write_html('output/pairs{}.html'.format(filekey), E.table(*tablerows))
 
 
 def main():
-    with open('output/extract2.json') as f:
-        data = json.load(f)
-    limit(data, '', lambda f,s: True)
-    limit(data, '-abbr', lambda f,s: s)
-    limit(data, '-1', lambda f,s: f == 1)
-    limit(data, '-1-abbr', lambda f,s: s and f == 1)
-    limit(data, '-rare', lambda f,s: f <= 5)
-    limit(data, '-rare-abbr', lambda f,s: s and f <= 5)
-    limit(data, '-common', lambda f,s: f > 5)
-    limit(data, '-common-abbr', lambda f,s: s and f > 5)
-    limit(data, '-verycommon', lambda f,s: f > 10)
-    limit(data, '-verycommon-abbr', lambda f,s: s and f > 10)
+    data = Columns('output/extract2.npz')
+    assert set(data.texts) <= set(ALL_TEXTS)
+    classes = class_masks(data)
+    limit(data, classes, '', lambda f,s: True)
+    limit(data, classes, '-abbr', lambda f,s: s)
+    limit(data, classes, '-1', lambda f,s: f == 1)
+    limit(data, classes, '-1-abbr', lambda f,s: s & (f == 1))
+    limit(data, classes, '-rare', lambda f,s: f <= 5)
+    limit(data, classes, '-rare-abbr', lambda f,s: s & (f <= 5))
+    limit(data, classes, '-common', lambda f,s: f > 5)
+    limit(data, classes, '-common-abbr', lambda f,s: s & (f > 5))
+    limit(data, classes, '-verycommon', lambda f,s: f > 10)
+    limit(data, classes, '-verycommon-abbr', lambda f,s: s & (f > 10))
 
 main()
@@ -0,0 +1,43 @@
+import numpy as np
+
+class Patterns:
+    # Counts of abbreviation patterns from summary.npz. Pattern i is
+    # coded as a base-3 number: digit j is 0 or 1 depending on whether
+    # the word is abbreviated in text j, or 2 if text j is missing.
+    def __init__(self, filename):
+        with np.load(filename) as f:
+            self.texts = [str(x) for x in f['texts']]
+            self.codes = f['codes']
+            self.counts = f['counts']
+        self.n = len(self.texts)
+        self.digits = self.codes[:,None] // 3 ** np.arange(self.n) % 3
+
+    def full(self):
+        # Patterns in which every text is present.
+        return np.all(self.digits < 2, axis=1)
+
+    def some(self):
+        # Patterns in which at least one text has an abbreviation.
+        return np.any(self.digits == 1, axis=1)
+
+    def marginal(self, subset, mask=None):
+        # Counts for the texts in subset, as an array of shape (3,)*k.
+        subset = list(subset)
+        counts = self.counts if mask is None else self.counts * mask
+        result = np.zeros((3,) * len(subset), dtype=np.int64)
+        np.add.at(result, tuple(self.digits[:,j] for j in subset), counts)
+        return result
+
+    def onehot(self, mask=None):
+        counts = self.counts if mask is None else self.counts * mask
+        return counts, np.eye(3, dtype=np.int64)[self.digits]
+
+    def pairs(self, mask=None):
+        # All pairwise marginals at once: result[i,j,a,b].
+        counts, h = self.onehot(mask)
+        return np.einsum('m,mia,mjb->ijab', counts, h, h)
+
+    def triples(self, mask=None):
+        # All three-way marginals at once: result[i,j,k,a,b,c].
+        counts, h = self.onehot(mask)
+        return np.einsum('m,mia,mjb,mkc->ijkabc', counts, h, h, h)
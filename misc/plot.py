@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 
-import json
+import itertools
 import pandas as pd
 import numpy as np
 import plotly.offline as py
+from parsing.records import read_jsonl
 
 TEXTS = [
     "Sloane2320",
@@ -25,9 +26,6 @@ def smooth(window, x):
     return pd.Series(x).rolling(window, win_type='triang', center=True).mean()
 
 def plot(what, window):
-    with open('output/extract.json') as f:
-        data = json.load(f)
-
     keys1 = TEXTS + ['min', 'avg', 'max']
     if what is None:
         keys = keys1 + MORE
@@ -46,28 +44,31 @@ def plot(what, window):
             rows2[x] = []
 
     start = 0
-    for chunk in data:
+    # The records of each chunk are consecutive.
+    for key, records in itertools.groupby(read_jsonl('output/extract.jsonl'), lambda r: r['key']):
+        records = list(records)
+        chunk = records[0]
         if prevchapter != chunk['chapter']:
             if prevchapter is not None:
                 flush()
             prevchapter = chunk['chapter']
         textmap = { x: i for i,x in enumerate(chunk['texts']) }
-        clmap = { x: i for i,x in enumerate(chunk['classes']) }
 
         filtered = []
-        for row,cl,words in chunk['rows']:
+        for record in records:
+            cl = record['classes']
             classes = set()
-            y = cl[clmap['lex-funct']]
+            y = cl['lex-funct']
             assert y in ['func', 'lex']
             classes.add(y)
             for x in ['numeral', 'measurement', 'three syllables']:
-                y = cl[clmap[x]]
+                y = cl[x]
                 assert y in ['yes', 'no', '']
                 if y == 'yes':
                     classes.add(x)
 
             if what is None or what in classes:
-                filtered.append([row, words])
+                filtered.append([record['abbr'], record['words']])
             if what is None:
                 for x in MORE:
                     rows2[x].append(1 if x in classes else 0)
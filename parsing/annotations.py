@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+import openpyxl
+import xlsxwriter
+
+STORE = 'data/jburgundy.sqlite'
+WORKBOOK = 'data/jburgundy.xlsx'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sheets (
+    position INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rows (
+    sheet INTEGER NOT NULL REFERENCES sheets(position),
+    r INTEGER NOT NULL,
+    cells TEXT NOT NULL,
+    PRIMARY KEY (sheet, r)
+);
+CREATE TABLE IF NOT EXISTS formats (
+    id INTEGER PRIMARY KEY,
+    spec TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS styles (
+    sheet INTEGER NOT NULL REFERENCES sheets(position),
+    r INTEGER NOT NULL,
+    cells TEXT NOT NULL,
+    PRIMARY KEY (sheet, r)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+def cell_value(x):
+    # Same conventions as xlrd: empty cells are '' and numbers are floats.
+    if x is None:
+        return ''
+    if isinstance(x, (int, float)) and not isinstance(x, bool):
+        return float(x)
+    return x
+
+def cell_format(cell):
+    # The parts of the cell format that align.py sets, as xlsxwriter
+    # format properties.
+    font = getattr(cell, 'font', None)
+    if font is None:
+        return {}
+    spec = {}
+    if font.b:
+        spec['bold'] = True
+    if font.color is not None and isinstance(font.color.rgb, str):
+        spec['color'] = '#' + font.color.rgb[2:].lower()
+    if cell.alignment.horizontal is not None:
+        spec['align'] = cell.alignment.horizontal
+    return spec
+
+
+class Store:
+    # The contents of the annotated workbook, one JSON list per row.
+    def __init__(self, filename):
+        self.db = sqlite3.connect(filename)
+        self.db.executescript(SCHEMA)
+
+    def sheet_names(self):
+        return [name for (name,) in self.db.execute('SELECT name FROM sheets ORDER BY position')]
+
+    def read_sheet(self, name):
+        rows = self.db.execute(
+            'SELECT cells FROM rows JOIN sheets ON rows.sheet = sheets.position WHERE sheets.name = ? ORDER BY r',
+            (name,))
+        return [json.loads(cells) for (cells,) in rows]
+
+    def read_styles(self, name):
+        # For each row, the format of each cell as a dict ({} = default),
+        # or None if the sheet was imported without formats.
+        formats = { i: json.loads(spec) for i, spec in self.db.execute('SELECT id, spec FROM formats') }
+        rows = self.db.execute(
+            'SELECT r, styles.cells FROM styles JOIN sheets ON styles.sheet = sheets.position WHERE sheets.name = ? ORDER BY r',
+            (name,))
+        result = {}
+        for r, cells in rows:
+            result[r] = [formats[i] for i in json.loads(cells)]
+        return result
+
+    def replace(self, sheets, source):
+        with self.db:
+            self.db.execute('DELETE FROM rows')
+            self.db.execute('DELETE FROM styles')
+            self.db.execute('DELETE FROM formats')
+            self.db.execute('DELETE FROM sheets')
+            formats = {}
+            def format_id(spec):
+                spec = json.dumps(spec, sort_keys=True)
+                if spec not in formats:
+                    formats[spec] = len(formats)
+                    self.db.execute('INSERT INTO formats VALUES (?, ?)', (formats[spec], spec))
+                return formats[spec]
+            for position, (name, table, styles) in enumerate(sheets):
+                self.db.execute('INSERT INTO sheets VALUES (?, ?)', (position, name))
+                self.db.executemany('INSERT INTO rows VALUES (?, ?, ?)',
+                    ((position, r, json.dumps(values, ensure_ascii=False)) for r, values in enumerate(table)))
+                self.db.executemany('INSERT INTO styles VALUES (?, ?, ?)',
+                    ((position, r, json.dumps([format_id(x) for x in specs])) for r, specs in enumerate(styles)))
+            self.db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('source', source))
+            self.db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('imported', time.strftime('%Y-%m-%d %H:%M:%S')))
+
+
+def read_workbook(filename):
+    wb = openpyxl.load_workbook(filename, read_only=True, data_only=True)
+    for ws in wb.worksheets:
+        table = []
+        styles = []
+        for cells in ws.iter_rows():
+            table.append([cell_value(x.value) for x in cells])
+            styles.append([cell_format(x) for x in cells])
+        ncols = max((len(values) for values in table), default=0)
+        for values, specs in zip(table, styles):
+            values.extend([''] * (ncols - len(values)))
+            specs.extend([{}] * (ncols - len(specs)))
+        while len(table) and all(x == '' for x in table[-1]):
+            table.pop()
+            styles.pop()
+        yield ws.title, table, styles
+    wb.close()
+
+def write_workbook(filename, store):
+    # The same layout as the workbook of align.py: column widths 5 / 16
+    # for each witness and 8 for score and fix, and the formats of the
+    # cells as imported (gaps, abbreviations, scores).
+    wb = xlsxwriter.Workbook(filename, {'constant_memory': True})
+    formats = {}
+    def get_format(spec):
+        key = json.dumps(spec, sort_keys=True)
+        if key not in formats:
+            formats[key] = wb.add_format(spec) if len(spec) else None
+        return formats[key]
+    bold = {'bold': True}
+    for name in store.sheet_names():
+        ws = wb.add_worksheet(name)
+        table = store.read_sheet(name)
+        styles = store.read_styles(name)
+        if len(table):
+            for c, x in enumerate(table[0]):
+                if x == '#':
+                    ws.set_column(c, c, 5)
+                    ws.set_column(c+1, c+1, 16)
+                elif x in ('score', 'fix'):
+                    ws.set_column(c, c, 8)
+        for r, values in enumerate(table):
+            specs = styles.get(r)
+            for c, x in enumerate(values):
+                if specs is not None:
+                    f = get_format(specs[c])
+                else:
+                    f = get_format(bold if r == 0 else {})
+                if x == '':
+                    ws.write_blank(r, c, None, f)
+                elif isinstance(x, float):
+                    ws.write_number(r, c, x, f)
+                else:
+                    ws.write_string(r, c, x, f)
+    wb.close()
+
+
+def do_import(args):
+    store = Store(args.store)
+    store.replace(list(read_workbook(args.workbook)), os.path.abspath(args.workbook))
+    print('{}: {} sheets'.format(args.store, len(store.sheet_names())))
+
+def do_export(args):
+    write_workbook(args.workbook, Store(args.store))
+    print(args.workbook)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--store', default=STORE)
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('import', help='read the annotated workbook into the store')
+    p.add_argument('workbook', nargs='?', default=WORKBOOK)
+    p.set_defaults(run=do_import)
+    p = sub.add_parser('export', help='write the store back to an Excel file for the annotators')
+    p.add_argument('workbook', nargs='?', default='output/jburgundy-annotations.xlsx')
+    p.set_defaults(run=do_export)
+    args = parser.parse_args()
+    args.run(args)
+
+if __name__ == '__main__':
+    main()
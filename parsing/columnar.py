@@ -0,0 +1,97 @@
+import numpy as np
+
+# extract.json / extract2.json in columnar form, one row per aligned word.
+#
+#   texts               all witnesses (columns of the matrices below)
+#   abbr                words x witnesses, 1/0, or -1 if the witness is missing
+#   present             words x witnesses, False if the witness is missing
+#   word, short         words x witnesses, codes into word_values / short_values,
+#                       or -1 if the witness is missing
+#   key, name, chapter, kind, language
+#                       codes into <column>_values
+#   classes             names of the classes; class i is either a numeric
+#                       array class<i>, or codes class<i> into class<i>_values
+
+CHUNK_COLUMNS = ['key', 'name', 'chapter', 'kind', 'language']
+
+def encode(values):
+    vocab = sorted(set(values))
+    index = { v: i for i,v in enumerate(vocab) }
+    codes = np.array([index[v] for v in values], dtype=np.int32)
+    return codes, np.array(vocab, dtype=str)
+
+def write_npz(filename, data):
+    texts = sorted(set(x for chunk in data for x in chunk['texts']))
+    col = { x: j for j,x in enumerate(texts) }
+    classes = data[0]['classes'] if len(data) else []
+    m = sum(len(chunk['rows']) for chunk in data)
+    abbr = np.full((m, len(texts)), -1, dtype=np.int8)
+    words = []
+    shorts = []
+    where = []
+    meta = { x: [] for x in CHUNK_COLUMNS }
+    cls = [ [] for x in classes ]
+    i = 0
+    for chunk in data:
+        assert chunk['classes'] == classes
+        cc = [ col[x] for x in chunk['texts'] ]
+        for row, cl, ww, ss in chunk['rows']:
+            abbr[i, cc] = row
+            for j, w, s in zip(cc, ww, ss):
+                where.append((i, j))
+                words.append(w)
+                shorts.append(s)
+            for x in CHUNK_COLUMNS:
+                meta[x].append(chunk[x])
+            for k, v in enumerate(cl):
+                cls[k].append(v)
+            i += 1
+    arrays = {
+        'texts': np.array(texts, dtype=str),
+        'abbr': abbr,
+        'present': abbr >= 0,
+        'classes': np.array(classes, dtype=str),
+    }
+    ii = tuple(np.array(where, dtype=np.int64).reshape(-1, 2).T)
+    for name, values in [('word', words), ('short', shorts)]:
+        codes, vocab = encode(values)
+        matrix = np.full((m, len(texts)), -1, dtype=np.int32)
+        matrix[ii] = codes
+        arrays[name] = matrix
+        arrays[name + '_values'] = vocab
+    for x in CHUNK_COLUMNS:
+        arrays[x], arrays[x + '_values'] = encode(meta[x])
+    for k, values in enumerate(cls):
+        if all(isinstance(v, int) for v in values):
+            arrays['class{}'.format(k)] = np.array(values, dtype=np.int64)
+        else:
+            arrays['class{}'.format(k)], arrays['class{}_values'.format(k)] = encode(values)
+    np.savez_compressed(filename, **arrays)
+
+
+class Columns:
+    # Loader for the files written by write_npz. The arrays are available
+    # as they are stored (codes), and decoded with column(name).
+    def __init__(self, filename):
+        with np.load(filename) as f:
+            self.arrays = { x: f[x] for x in f.files }
+        self.texts = [ str(x) for x in self.arrays['texts'] ]
+        self.classes = [ str(x) for x in self.arrays['classes'] ]
+        self.abbr = self.arrays['abbr']
+        self.present = self.arrays['present']
+        self.rows = self.abbr.shape[0]
+
+    def codes(self, name):
+        # Codes and vocabulary of a column (vocabulary None if numeric).
+        if name in self.classes:
+            name = 'class{}'.format(self.classes.index(name))
+        return self.arrays[name], self.arrays.get(name + '_values')
+
+    def column(self, name):
+        codes, vocab = self.codes(name)
+        if vocab is None:
+            return codes
+        result = vocab[np.maximum(codes, 0)]
+        if codes.ndim == 2:
+            result = np.where(codes >= 0, result, '')
+        return result
@@ -1,14 +1,30 @@
 #!/usr/bin/env python3
 
+import argparse
 import collections
 import glob
+import hashlib
 import json
+import multiprocessing
+import os
 import re
+import sys
 import lxml
-from lxml.builder import E
 import xlrd
+from annotations import Store, STORE, WORKBOOK
+from records import write_jsonl
+from columnar import write_npz
+from validate import check_sheet, fix_class
+from common import CLLABELS, file_hash, words_hash
+
+CACHE = 'output/extract-cache'
+# Change this whenever extract_one changes, to invalidate the cache.
+CACHE_VERSION = 1
+MANIFEST = 'output/manifest.json'
+CORPUS = 'output/extract-corpus.json'
+# Change this whenever the XML parser changes, to invalidate the parsed corpus.
+CORPUS_VERSION = 1
 
-CLLABELS  = ['A lex-funct', 'B numeral?', 'C measurement?', 'D Three syllables?', 'E Per']
 CLLABELS2 = [  'lex-funct',   'numeral',    'measurement',    'three syllables',  'per'  ]
 
 AM_MAP = {
@@ -135,19 +151,53 @@ class Chunk:
         self.words = []
 
 class Text:
-    def __init__(self, label, filename):
+    def __init__(self, label, filename, chunks=None):
         self.label = label
         self.filename = filename
+        self.chunk_map = {}
+        if chunks is not None:
+            self.chunks = chunks
+            for c in chunks:
+                self.chunk_map[c.key] = c
+            return
         tree = lxml.etree.parse(filename)
         root = tree.getroot()
         body = root.find(tei('text')).find(tei('body'))
         self.chunk = None
         self.chunks = []
-        self.chunk_map = {}
         self.parse_top(body)
         assert self.chunk is None
         self.cleanup()
 
+    def dump(self):
+        return {
+            'label': self.label,
+            'filename': self.filename,
+            'chunks': [{
+                'key': c.key,
+                'name': c.name,
+                'chapter': c.chapter,
+                'label': c.label,
+                'kind': c.kind,
+                'language': c.language,
+                'words': [[w.full, w.short, w.abbr] for w in c.words],
+            } for c in self.chunks],
+        }
+
+    @staticmethod
+    def load(dump):
+        chunks = []
+        for d in dump['chunks']:
+            c = Chunk(d['chapter'], d['label'])
+            c.key, c.name, c.kind, c.language = d['key'], d['name'], d['kind'], d['language']
+            for full, short, abbr in d['words']:
+                w = Word()
+                w.full, w.short, w.abbr = full, short, abbr
+                c.words.append(w)
+            c.wc = len(c.words)
+            chunks.append(c)
+        return Text(dump['label'], dump['filename'], chunks)
+
     def cleanup(self):
         for c in self.chunks:
             c.key2 = None
@@ -326,19 +376,25 @@ def common(chunks, what):
     assert len(s) == 1
     return list(s)[0]
 
-def fix_class(s):
-    s = s.lower().strip()
-    if s in ['ye', 'yes¨']:
-        s = 'yes'
-    return s
+# The Align object that the worker processes inherit from the parent.
+worker_align = None
+
+def worker_init():
+    # The workbook is inherited as it is, but an SQLite connection must not
+    # be used on both sides of a fork, so each worker opens the store again.
+    if worker_align.store is not None:
+        worker_align.store = Store(STORE)
+
+def worker_extract(key):
+    return worker_align.extract_cached(key)
+
 
 class Align:
-    def __init__(self):
+    def __init__(self, jobs=1, cache=True):
         self.text_map = {}
         self.texts = []
-        self.fixes0 = 0
-        self.fixes1 = 0
-        self.rows = 0
+        self.jobs = jobs
+        self.cache = cache
 
     def feed(self, label, filename):
         assert label not in self.texts
@@ -346,6 +402,65 @@ class Align:
         self.text_map[label] = text
         self.texts.append(text)
 
+    def feed_all(self):
+        files = []
+        for filename in sorted(glob.glob('data/*.xml')):
+            m = re.fullmatch(r'data/(.*)_DSH_final\.xml', filename)
+            assert m
+            label = m.group(1)
+            files.append([label, filename, file_hash(filename)])
+        self.files = files
+        # Reuse the parsed corpus if none of the XML files has changed.
+        if os.path.exists(CORPUS):
+            with open(CORPUS) as f:
+                corpus = json.load(f)
+            if corpus['version'] == CORPUS_VERSION and corpus['files'] == files:
+                for dump in corpus['texts']:
+                    text = Text.load(dump)
+                    self.text_map[text.label] = text
+                    self.texts.append(text)
+                print('parsed corpus: {}'.format(CORPUS))
+                return
+        for label, filename, h in files:
+            self.feed(label, filename)
+        os.makedirs(os.path.dirname(CORPUS), exist_ok=True)
+        with open(CORPUS, 'w') as f:
+            json.dump({
+                'version': CORPUS_VERSION,
+                'files': files,
+                'texts': [text.dump() for text in self.texts],
+            }, f)
+
+    def check_manifest(self):
+        # Checks that the texts are the ones that align.py saw, and
+        # that both scripts split them into the same keys and words, with
+        # the same full forms and abbreviations.
+        if not os.path.exists(MANIFEST):
+            print('warning: {} not found, run align.py to create it'.format(MANIFEST))
+            return
+        with open(MANIFEST) as f:
+            manifest = json.load(f)
+        seen = [[t['label'], t['filename'], t['sha256']] for t in manifest['texts']]
+        if seen != self.files:
+            changed = sorted({x[1] for x in seen if x not in self.files} | {x[1] for x in self.files if x not in seen})
+            print('warning: XML files changed since align.py was run: {}'.format(', '.join(changed)))
+            return
+        problems = []
+        if sorted(manifest['keys']) != sorted(self.names):
+            problems.append('keys {} in {}, {} in XML files'.format(sorted(manifest['keys']), MANIFEST, sorted(self.names)))
+        for key in sorted(set(manifest['keys']) & set(self.names)):
+            m = manifest['keys'][key]
+            labels, chunks = self.witnesses(key)
+            got = [self.names[key], labels, [len(c.words) for c in chunks]]
+            if got != [m['name'], m['texts'], m['words']]:
+                problems.append('{}: {} in {}, {} in XML files'.format(key, [m['name'], m['texts'], m['words']], MANIFEST, got))
+            elif [words_hash(c.words) for c in chunks] != m['sha256']:
+                problems.append('{}: words differ from {}'.format(key, MANIFEST))
+        if len(problems):
+            for x in problems:
+                print(x)
+            sys.exit('XML files parsed differently from align.py')
+
     def process(self):
         self.names = {}
         for text in self.texts:
@@ -354,73 +469,139 @@ class Align:
                     assert self.names[chunk.key] == chunk.name
                 else:
                     self.names[chunk.key] = chunk.name
-        self.book = xlrd.open_workbook('data/jburgundy.xlsx')
+        self.check_manifest()
+        keys = sorted(self.names.keys())
+        self.open_annotations()
+        if self.jobs > 1:
+            global worker_align
+            worker_align = self
+            ctx = multiprocessing.get_context('fork')
+            with ctx.Pool(self.jobs, initializer=worker_init) as pool:
+                extracted = pool.map(worker_extract, keys)
+        else:
+            extracted = map(self.extract_cached, keys)
         result = []
-        for key in sorted(self.names.keys()):
-            record = self.extract_one(key)
-            if record is not None:
-                result.append(record)
+        count = collections.Counter()
+        extracted = list(extracted)
+        violations = [v for x in extracted for v in x[4]]
+        if len(violations):
+            for v in violations:
+                print('{}: row {}: {}'.format(*v))
+            sys.exit('{} problems found, nothing written'.format(len(violations)))
+        with open('output/extract.jsonl', 'w') as f:
+            for record, c, log, hit, problems in extracted:
+                count['cached'] += hit
+                for line in log:
+                    print(line)
+                count.update(c)
+                if record is not None:
+                    result.append(record)
+                    write_jsonl(f, record)
         with open('output/extract.json', 'w') as f:
             json.dump(result, f, sort_keys=True, indent=1)
-        print("rows: {}".format(self.rows))
-        print("fix 0: {}".format(self.fixes0))
-        print("fix 1: {}".format(self.fixes1))
+        write_npz('output/extract.npz', result)
+        print("rows: {}".format(count['rows']))
+        print("fix 0: {}".format(count['fix 0']))
+        print("fix 1: {}".format(count['fix 1']))
+        print("cached: {} of {} sheets".format(count['cached'], len(keys)))
+
+    def open_annotations(self):
+        # Prefer the annotation store; fall back to the workbook.
+        self.store = None
+        self.book = None
+        if os.path.exists(STORE):
+            if os.path.exists(WORKBOOK) and os.path.getmtime(WORKBOOK) > os.path.getmtime(STORE):
+                print('warning: {} is newer than {}, run annotations.py import'.format(WORKBOOK, STORE))
+            self.store = Store(STORE)
+        else:
+            self.book = xlrd.open_workbook(WORKBOOK)
 
-    def extract_one(self, key):
-        sheet = self.book.sheet_by_name(self.names[key])
+    def read_sheet(self, name):
+        if self.store is not None:
+            return self.store.read_sheet(name)
+        sheet = self.book.sheet_by_name(name)
+        return [sheet.row_values(r) for r in range(sheet.nrows)]
+
+    def witnesses(self, key):
         labels = []
         chunks = []
         for text in self.texts:
             if key in text.chunk_map:
                 labels.append(text.label)
                 chunks.append(text.chunk_map[key])
+        return labels, chunks
+
+    def digest(self, key, table):
+        # Everything that the result of extract_one depends on.
+        labels, chunks = self.witnesses(key)
+        h = hashlib.sha256()
+        h.update(json.dumps([CACHE_VERSION, key, self.names[key], labels, table]).encode('utf-8'))
+        for c in chunks:
+            h.update(json.dumps([c.chapter, c.kind, c.language]).encode('utf-8'))
+            for w in c.words:
+                h.update(json.dumps([w.full, w.short, w.abbr]).encode('utf-8'))
+        return h.hexdigest()
+
+    def extract_cached(self, key):
+        # Returns the result of extract_one, and whether it came from the cache.
+        table = self.read_sheet(self.names[key])
+        digest = self.digest(key, table)
+        filename = os.path.join(CACHE, '{}.json'.format(key))
+        if self.cache and os.path.exists(filename):
+            with open(filename) as f:
+                cached = json.load(f)
+            if cached['hash'] == digest:
+                return cached['record'], collections.Counter(cached['count']), cached['log'], True, []
+        labels, chunks = self.witnesses(key)
+        if len(chunks) > 1:
+            violations = check_sheet(self.names[key], table, labels, [len(c.words) for c in chunks])
+            if len(violations):
+                return None, collections.Counter(), [], False, violations
+        record, count, log = self.extract_one(key, table)
+        os.makedirs(CACHE, exist_ok=True)
+        with open(filename, 'w') as f:
+            json.dump({'hash': digest, 'record': record, 'count': count, 'log': log}, f, sort_keys=True)
+        return record, count, log, False, []
+
+    def extract_one(self, key, table):
+        # The sheet has already been validated with check_sheet.
+        labels, chunks = self.witnesses(key)
         n = len(chunks)
+        count = collections.Counter()
+        log = []
         if n == 1:
-            return None
+            return None, count, log
         # print(key, self.names[key], labels)
-        for j,label in enumerate(labels):
-            assert sheet.cell(0, 2*j).value == '#'
-            assert sheet.cell(0, 2*j+1).value == label
         cscore = 2*n
         cfix = cscore + 1
         ccl = cfix + 1
         ncl = len(CLLABELS)
-        got_head = [ sheet.cell(0, i).value for i in range(ccl, ccl+ncl) ]
-        assert got_head == CLLABELS, got_head
 
         rows = []
         count_good = 0
         count_bad = [0 for i in range(n)]
         current = [0 for i in range(n)]
-        for r in range(1, sheet.nrows):
-            score = sheet.cell(r, cscore).value
-            fix = sheet.cell(r, cfix).value
-            self.rows += 1
+        for r in range(1, len(table)):
+            values = table[r]
+            score = values[cscore]
+            fix = values[cfix]
+            count['rows'] += 1
             if fix == 1:
-                self.fixes1 += 1
-                assert score == ''
+                count['fix 1'] += 1
                 good = True
             elif fix == 0:
-                self.fixes0 += 1
-                assert score != ''
+                count['fix 0'] += 1
                 good = False
-            elif score != '':
-                good = True
-                assert good >= 1
-                assert fix == ''
             else:
-                good = False
-                assert fix == ''
+                good = score != ''
             row = []
             words = []
             short = []
-            for j in range(n):
-                v = sheet.cell(r, 2*j).value
+            for j,v in enumerate(values[0:2*n:2]):
                 if v == '':
                     row.append(None)
                 else:
                     v = int(v)
-                    assert current[j] == v
                     current[j] += 1
                     if not good:
                         count_bad[j] += 1
@@ -428,26 +609,17 @@ class Align:
                     row.append(1 if word.abbr else 0)
                     words.append(word.full)
                     short.append(word.short)
-            cl = [ fix_class(sheet.cell(r, i).value) for i in range(ccl, ccl+ncl) ]
-            assert cl[0] in ['func', 'lex', 'lex???', 'yes', 'no', '']
-            for i in range(1,4):
-                assert cl[i] in ['yes', 'no', '']
+            cl = [ fix_class(x) for x in values[ccl:ccl+ncl] ]
             if good:
                 count_good += 1
                 if cl[0] not in ['func', 'lex']:
-                    print('{}: row {}, {} = "{}"'.format(self.names[key], r+1, CLLABELS[0], cl[0]))
+                    log.append('{}: row {}, {} = "{}"'.format(self.names[key], r+1, CLLABELS[0], cl[0]))
                 # for i in range(1,4):
                 #     if cl[i] not in ['yes', 'no']:
                 #         print('{}: row {}, {} = "{}"'.format(self.names[key], r+1, CLLABELS[i], cl[i]))
-                for j in range(n):
-                    assert row[j] is not None
                 rows.append([row, cl, words, short])
                 # print(row, cl)
 
-        assert count_good == len(rows)
-        for j in range(n):
-            assert current[j] == len(chunks[j].words)
-            assert current[j] == count_good + count_bad[j]
 
         return {
             'key': key,
@@ -461,17 +633,17 @@ class Align:
             'aligned': count_good,
             'unaligned': count_bad,
             'total': current,
-        }
-
-fixes = collections.Counter()
+        }, count, log
 
 def main():
-    align = Align()
-    for filename in sorted(glob.glob('data/*.xml')):
-        m = re.fullmatch(r'data/(.*)_DSH_final\.xml', filename)
-        assert m
-        label = m.group(1)
-        align.feed(label, filename)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=1,
+        help='number of worker processes that extract the sheets in parallel')
+    parser.add_argument('--no-cache', action='store_true',
+        help='extract every sheet again, even if it has not changed')
+    args = parser.parse_args()
+    align = Align(args.jobs, not args.no_cache)
+    align.feed_all()
     align.process()
 
 main()
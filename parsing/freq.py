@@ -1,7 +1,17 @@
 #!/usr/bin/env python3
 
 from collections import defaultdict, Counter, OrderedDict
+import argparse
 import json
+import os
+from records import write_jsonl
+from columnar import write_npz
+from freqindex import FreqIndex, FREQ, mark
+from common import word_keys
+
+STATE = 'output/freq-state.json'
+# Change this whenever the format of STATE changes.
+STATE_VERSION = 2
 
 ALL_TEXTS = [
     "Sloane2320",
@@ -12,85 +22,514 @@ ALL_TEXTS = [
 def normalise(x):
     return x.lower()
 
+def deletes(x, d):
+    # All strings that we get from x by deleting at most d characters.
+    result = {x}
+    level = {x}
+    for k in range(d):
+        level = {y[:i] + y[i+1:] for y in level for i in range(len(y))}
+        result |= level
+    return result
+
+def edit_distance(a, b, d):
+    # Levenshtein distance, or d+1 if it is larger than d.
+    if abs(len(a) - len(b)) > d:
+        return d+1
+    prev = list(range(len(b)+1))
+    for i in range(1, len(a)+1):
+        cur = [i]
+        for j in range(1, len(b)+1):
+            cur.append(min(prev[j] + 1, cur[j-1] + 1, prev[j-1] + (a[i-1] != b[j-1])))
+        if min(cur) > d:
+            return d+1
+        prev = cur
+    return min(prev[-1], d+1)
+
+class UnionFind:
+    # Disjoint sets over integer ids 0, 1, ..., with union by size and
+    # path halving; no recursion, so long chains are fine.
+    def __init__(self):
+        self.p = []
+        self.size = []
+
+    def add(self):
+        i = len(self.p)
+        self.p.append(i)
+        self.size.append(1)
+        return i
+
+    def find(self, a):
+        p = self.p
+        while p[a] != a:
+            p[a] = p[p[a]]
+            a = p[a]
+        return a
+
+    def union(self, a, b):
+        a = self.find(a)
+        b = self.find(b)
+        if a == b:
+            return a
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.p[b] = a
+        self.size[a] += self.size[b]
+        return a
+
+
 class Similarity:
     def __init__(self):
-        self.p = {}
-        self.raw = []
+        # Each form is interned as an integer id.
+        self.ids = {}
+        self.forms = []
+        self.uf = UnionFind()
+        # For each root, the id of the least form in its set; the set is
+        # named after it.
+        self.least = []
+        # For each root, the number of rows, the numbers of unabbreviated
+        # and abbreviated words, and the same per witness.
+        self.rows = []
+        self.abbr = []
+        self.witness = []
+        # For each form, the number of words of this form, and the forms
+        # that it was merged with (with multiplicities), so that we can
+        # tell if removing a row would split a cluster.
+        self.uses = []
+        self.adj = []
+
+    def add(self, a):
+        i = self.ids.get(a)
+        if i is None:
+            i = self.uf.add()
+            self.ids[a] = i
+            self.forms.append(a)
+            self.least.append(i)
+            self.rows.append(0)
+            self.abbr.append([0, 0])
+            self.witness.append({})
+            self.uses.append(0)
+            self.adj.append({})
+        return i
 
-    def feed_many(self, row, l):
-        l = [normalise(a) for a in l]
-        self.raw.append((row, l))
-        for a in range(len(l)):
-            for b in range(a, len(l)):
-                self.merge(l[a], l[b])
+    def feed_many(self, row, l, texts):
+        # Returns the id of the row; after cluster(), get_count(id)
+        # gives the frequencies of its cluster.
+        i = self.add(normalise(l[0]))
+        self.add_words(i, l)
+        self.contribute(i, row, texts, 1)
+        return i
+
+    def add_words(self, i, l):
+        # The merges of a row are links from its id to each of its words.
+        for a in l:
+            j = self.add(normalise(a))
+            self.uses[j] += 1
+            self.link(i, j, 1)
+            self.merge(i, j)
+
+    def extend(self, i, row, l, texts):
+        # Adds new witnesses to a row that was fed earlier with id i; the
+        # row itself is already counted.
+        self.add_words(i, l)
+        self.contribute(i, row, texts, 1, rows=0)
+
+    def remove(self, i, row, l, texts):
+        # Removes a row that was fed earlier with id i. Returns False if
+        # the clusters may no longer be the same as without the row: a
+        # form is no longer used, or the cluster of the row is no longer
+        # connected by the remaining merges.
+        ids = [self.ids[normalise(a)] for a in l]
+        self.contribute(i, row, texts, -1)
+        for j in ids:
+            self.uses[j] -= 1
+            self.link(i, j, -1)
+        if any(self.uses[j] == 0 for j in ids):
+            return False
+        return self.connected(i)
+
+    def link(self, a, b, sign):
+        if a == b:
+            return
+        for x, y in [(a, b), (b, a)]:
+            c = self.adj[x].get(y, 0) + sign
+            if c:
+                self.adj[x][y] = c
+            else:
+                del self.adj[x][y]
+
+    def connected(self, a):
+        # Is the whole set of a reachable from a?
+        seen = {a}
+        todo = [a]
+        while todo:
+            x = todo.pop()
+            for y in self.adj[x]:
+                if y not in seen:
+                    seen.add(y)
+                    todo.append(y)
+        return len(seen) == self.uf.size[self.uf.find(a)]
+
+    def join(self, a, b):
+        # A merge that is not based on a row (fuzzy); it is kept as long
+        # as both forms are used.
+        m = self.merge(a, b)
+        if m:
+            self.link(a, b, 1)
+        return m
+
+    def contribute(self, i, row, texts, sign, rows=1):
+        # Adds (sign 1) or removes (sign -1) the counts of a row.
+        r = self.uf.find(i)
+        self.rows[r] += sign * rows
+        for v,text in zip(row, texts):
+            self.abbr[r][v] += sign
+            self.witness[r].setdefault(text, [0, 0])[v] += sign
 
     def merge(self, a, b):
-        self.add(a)
-        self.add(b)
-        ra = self.get(a)
-        rb = self.get(b)
-        k = [ra, rb]
-        k.sort()
-        self.p[k[1]] = k[0]
+        # Returns 1 if a and b were in different sets, and 0 otherwise.
+        ra = self.uf.find(a)
+        rb = self.uf.find(b)
+        if ra == rb:
+            return 0
+        la = self.least[ra]
+        lb = self.least[rb]
+        r = self.uf.union(ra, rb)
+        self.least[r] = la if self.forms[la] < self.forms[lb] else lb
+        o = rb if r == ra else ra
+        self.rows[r] += self.rows[o]
+        for v in range(2):
+            self.abbr[r][v] += self.abbr[o][v]
+        for text, c in self.witness[o].items():
+            w = self.witness[r].setdefault(text, [0, 0])
+            for v in range(2):
+                w[v] += c[v]
+        self.rows[o] = 0
+        self.abbr[o] = [0, 0]
+        self.witness[o] = {}
+        return 1
 
-    def add(self, a):
-        if a not in self.p:
-            self.p[a] = a
+    def fuzzy(self, d):
+        # Merges also forms that are never aligned with each other: forms
+        # with the same norm key, and forms with the same weak key whose
+        # norm keys are within edit distance d. Candidates are found with
+        # an index of deletions (as in SymSpell), keyed also by the weak
+        # key, so that we only compare forms that have the same weak key
+        # and a common deletion. Returns the number of merges.
+        by_norm = defaultdict(list)
+        weak = {}
+        for a,i in sorted(self.ids.items()):
+            n, w = word_keys(a)
+            if n != '':
+                by_norm[n].append(i)
+                weak[n] = w
+        merged = 0
+        for n, ii in sorted(by_norm.items()):
+            for i in ii[1:]:
+                merged += self.join(ii[0], i)
+        if d == 0:
+            return merged
+        index = defaultdict(list)
+        for n in sorted(by_norm.keys()):
+            for x in deletes(n, d):
+                index[(weak[n], x)].append(n)
+        # Pairs that share several deletions are compared only once: a
+        # pair that is too far apart is remembered, and a pair that is
+        # already in the same cluster is skipped.
+        far = set()
+        for k in sorted(index.keys()):
+            nn = index[k]
+            for p in range(len(nn)):
+                for q in range(p+1, len(nn)):
+                    a, b = nn[p], nn[q]
+                    i, j = by_norm[a][0], by_norm[b][0]
+                    if self.uf.find(i) == self.uf.find(j) or (a, b) in far:
+                        continue
+                    if edit_distance(a, b, d) <= d:
+                        merged += self.join(i, j)
+                    else:
+                        far.add((a, b))
+        return merged
+
+    def name(self, i):
+        return self.forms[self.least[self.uf.find(i)]]
 
     def get(self, a):
-        if self.p[a] == a:
-            return a
-        else:
-            x = self.get(self.p[a])
-            self.p[a] = x
-            return x
+        return self.name(self.ids[a])
 
     def cluster(self):
         self.comp = defaultdict(list)
-        aa = sorted(self.p.keys())
-        for a in aa:
-            x = self.get(a)
-            self.comp[x].append(a)
+        for a in sorted(self.ids.keys()):
+            self.comp[self.get(a)].append(a)
         self.count = Counter()
         self.count01 = [Counter(), Counter()]
-        for row,l in self.raw:
-            x = self.get(l[0])
-            self.count[x] += 1
-            for v in row:
-                self.count01[v][x] += 1
+        self.count_witness = defaultdict(Counter)
+        for r in range(len(self.forms)):
+            if self.uf.p[r] != r or self.rows[r] == 0:
+                continue
+            x = self.name(r)
+            self.count[x] = self.rows[r]
+            for v in range(2):
+                if self.abbr[r][v]:
+                    self.count01[v][x] = self.abbr[r][v]
+            for text, c in self.witness[r].items():
+                for v in range(2):
+                    if c[v]:
+                        self.count_witness[x][(text, v)] = c[v]
 
     def dump(self):
         xx = sorted(self.count.most_common(), key=lambda p: (-p[1], p[0]))
         for x,c in xx:
             f0, f1 = [ self.count01[i][x] for i in range(2) ]
-            if f1 == 0:
-                mark = '-'
-            elif f1 >= f0:
-                mark = '#'
-            else:
-                mark = '+'
-            print(mark, c, ' '.join(self.comp[x]))
+            print(mark(f0, f1), c, ' '.join(self.comp[x]))
 
-    def get_count(self, l):
-        norm = [self.get(normalise(a)) for a in l]
-        assert len(set(norm)) == 1
-        norm = norm[0]
-        return self.count[norm], self.count01[0][norm], self.count01[1][norm]
+    def index_rows(self, language, funclex):
+        # Rows of the tables clusters, witnesses, and forms in FreqIndex.
+        clusters = []
+        witnesses = []
+        forms = []
+        for x in sorted(self.count.keys()):
+            f0, f1 = [ self.count01[i][x] for i in range(2) ]
+            clusters.append((language, funclex, x, ' '.join(self.comp[x]), self.count[x], f1, f0, mark(f0, f1)))
+            for text in sorted({t for t,v in self.count_witness[x]}):
+                w0, w1 = [ self.count_witness[x][(text, i)] for i in range(2) ]
+                witnesses.append((language, funclex, x, text, w0 + w1, w1, w0))
+            for a in self.comp[x]:
+                forms.append((language, funclex, a, x))
+        return clusters, witnesses, forms
 
+    def cluster_map(self, language, funclex):
+        # Cluster i is the i-th cluster in the order of names; forms maps
+        # each normalised form to its cluster.
+        names = sorted(self.comp.keys())
+        index = { x: i for i,x in enumerate(names) }
+        return OrderedDict([
+            ('language', language),
+            ('lex-funct', funclex),
+            ('forms', OrderedDict((a, index[self.get(a)]) for a in sorted(self.ids.keys()))),
+            ('clusters', [OrderedDict([
+                ('name', x),
+                ('forms', self.comp[x]),
+                ('count', self.count[x]),
+                ('count0', self.count01[0][x]),
+                ('count1', self.count01[1][x]),
+            ]) for x in names]),
+        ])
 
-def main():
-    with open('output/extract.json') as f:
-        data = json.load(f)
+    def get_count(self, i):
+        x = self.name(i)
+        return self.count[x], self.count01[0][x], self.count01[1][x]
+
+    def save(self):
+        return {
+            'forms': self.forms,
+            'p': self.uf.p,
+            'size': self.uf.size,
+            'least': self.least,
+            'rows': self.rows,
+            'abbr': self.abbr,
+            'witness': self.witness,
+            'uses': self.uses,
+            'adj': [sorted(a.items()) for a in self.adj],
+        }
+
+    @staticmethod
+    def load(state):
+        s = Similarity()
+        s.forms = state['forms']
+        s.ids = { a: i for i,a in enumerate(s.forms) }
+        s.uf.p = state['p']
+        s.uf.size = state['size']
+        s.least = state['least']
+        s.rows = state['rows']
+        s.abbr = state['abbr']
+        s.witness = state['witness']
+        s.uses = state['uses']
+        s.adj = [dict(a) for a in state['adj']]
+        return s
 
-    sim = defaultdict(Similarity)
 
+class Clusters:
+    # The clusters of all partitions (language, lex-funct), and what was
+    # fed from each row, so that they can be saved and later updated with
+    # only the new, changed and removed rows.
+    def __init__(self, fuzzy=None):
+        self.sim = defaultdict(Similarity)
+        self.fed = {}
+        self.chunks = {}
+        self.fuzzy = fuzzy
+
+    def feed(self, key, chunk, part, row, texts, words):
+        i = self.sim[part].feed_many(row, words, texts)
+        self.fed[key] = [chunk, list(part), row, texts, [normalise(a) for a in words], i]
+        return i
+
+    def extend(self, key, chunk, part, row, texts, words):
+        # Adds the witnesses that are new in a row that is otherwise the
+        # same as before (see extends).
+        old = self.fed[key]
+        i = old[5]
+        new = [ j for j,t in enumerate(texts) if t not in old[3] ]
+        self.sim[part].extend(i, [row[j] for j in new], [words[j] for j in new], [texts[j] for j in new])
+        self.fed[key] = [chunk, list(part), row, texts, [normalise(a) for a in words], i]
+        return i
+
+    def remove(self, entry):
+        # Removes what was fed from a row; returns the partition of the
+        # row, and False if the partition has to be clustered again.
+        chunk, part, row, texts, words, i = entry
+        part = tuple(part)
+        return part, self.sim[part].remove(i, row, words, texts)
+
+    def save(self, filename, keys):
+        with open(filename, 'w') as f:
+            json.dump({
+                'version': STATE_VERSION,
+                'fuzzy': self.fuzzy,
+                'partitions': [[list(k), self.sim[k].save()] for k in sorted(self.sim.keys())],
+                'chunks': self.chunks,
+                'rows': [self.fed[key] for key in keys],
+            }, f)
+
+    @staticmethod
+    def load(filename):
+        with open(filename) as f:
+            state = json.load(f)
+        if state.get('version') != STATE_VERSION:
+            return None
+        c = Clusters(state['fuzzy'])
+        for k, s in state['partitions']:
+            c.sim[tuple(k)] = Similarity.load(s)
+        c.chunks = state['chunks']
+        rows = state['rows']
+        keys = row_keys([(chunk, part, row, texts, words) for chunk, part, row, texts, words, i in rows], c.chunks)
+        c.fed = dict(zip(keys, rows))
+        return c
+
+
+def row_records(data):
     for chunk in data:
-        language = chunk['language']
-        textmap = { x: i for i,x in enumerate(chunk['texts']) }
         clmap = { x: i for i,x in enumerate(chunk['classes']) }
         for row,cl,words,short in chunk['rows']:
-            funclex = cl[clmap['lex-funct']]
-            sim[(language,funclex)].feed_many(row,words)
+            part = (chunk['language'], cl[clmap['lex-funct']])
+            yield chunk['key'], part, row, chunk['texts'], words, cl
+
+def row_keys(records, chunks):
+    # A key for each row that stays the same when witnesses are added
+    # or rows are removed: the chunk, the words of the witnesses that
+    # the chunk had in the saved state (chunks), and a number to tell
+    # apart rows with the same words.
+    seen = Counter()
+    keys = []
+    for x in records:
+        chunk, part, row, texts, words = x[:5]
+        old = chunks.get(chunk, texts)
+        pairs = [ [t, normalise(w)] for t,w in zip(texts, words) if t in old ]
+        k = json.dumps([chunk, pairs])
+        seen[k] += 1
+        keys.append('{} {}'.format(k, seen[k]))
+    return keys
+
+def extends(old, part, row, texts, words):
+    # Is the row the same as the saved one apart from new witnesses? Then
+    # its words can be added without removing anything.
+    if old[1] != list(part) or not set(old[3]) < set(texts):
+        return False
+    new = { t: (v, normalise(w)) for t,v,w in zip(texts, row, words) }
+    return all(new[t] == (v, w) for t,v,w in zip(old[3], old[2], old[4]))
+
+def chunk_texts(records):
+    return { x[0]: x[3] for x in records }
+
+def incremental(filename, fuzzy, records):
+    # Updates the saved clusters with the new, extended, changed and
+    # removed rows; a partition is clustered again only if a removed row
+    # may have been what joined two of its clusters. Returns the clusters, the id and
+    # key of each row, or None if everything has to be clustered again.
+    if not os.path.exists(filename):
+        print('{} not found, clustering all rows'.format(filename))
+        return None
+    clusters = Clusters.load(filename)
+    if clusters is None:
+        print('{} is from an older version, clustering all rows'.format(filename))
+        return None
+    if clusters.fuzzy != fuzzy:
+        print('--fuzzy changed, clustering all rows')
+        return None
+    keys = row_keys(records, clusters.chunks)
+    count = Counter()
+    dirty = set()
+    ids = []
+    for key, (chunk, part, row, texts, words, cl) in zip(keys, records):
+        old = clusters.fed.get(key)
+        if old is not None and old[1:5] == [list(part), row, texts, [normalise(a) for a in words]]:
+            count['unchanged'] += 1
+            ids.append(old[5])
+            continue
+        if old is not None and extends(old, part, row, texts, words):
+            count['extended'] += 1
+            ids.append(clusters.extend(key, chunk, part, row, texts, words))
+            continue
+        # The new version of a changed row is fed before the old one is
+        # removed, so that merges that it still supports are kept.
+        ids.append(clusters.feed(key, chunk, part, row, texts, words))
+        if old is None:
+            count['new'] += 1
+        else:
+            count['changed'] += 1
+            opart, ok = clusters.remove(old)
+            if not ok:
+                dirty.add(opart)
+    present = set(keys)
+    for key in [k for k in clusters.fed if k not in present]:
+        count['removed'] += 1
+        part, ok = clusters.remove(clusters.fed.pop(key))
+        if not ok:
+            dirty.add(part)
+    for part in sorted(dirty):
+        clusters.sim[part] = Similarity()
+        for j, (key, x) in enumerate(zip(keys, records)):
+            if x[1] == part:
+                ids[j] = clusters.feed(key, *x[:5])
+    clusters.chunks = chunk_texts(records)
+    print('incremental: {} new, {} extended, {} changed, {} removed, {} unchanged rows'.format(count['new'], count['extended'], count['changed'], count['removed'], count['unchanged']))
+    for part in sorted(dirty):
+        print('clustered again: {}'.format(' '.join(part)))
+    print()
+    return clusters, ids, keys
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fuzzy', type=int, metavar='D',
+        help='also merge forms that are never aligned with each other but have the same norm key, or the same weak key and norm keys within edit distance D')
+    parser.add_argument('--incremental', action='store_true',
+        help='update the clusters saved by the previous run with the new and changed rows only')
+    args = parser.parse_args()
+
+    with open('output/extract.json') as f:
+        data = json.load(f)
+
+    records = list(row_records(data))
+    result = None
+    if args.incremental:
+        result = incremental(STATE, args.fuzzy, records)
+    if result is None:
+        clusters = Clusters(args.fuzzy)
+        clusters.chunks = chunk_texts(records)
+        keys = row_keys(records, clusters.chunks)
+        ids = [clusters.feed(key, *x[:5]) for key, x in zip(keys, records)]
+    else:
+        clusters, ids, keys = result
+    sim = clusters.sim
+    pending = [(x[5], sim[x[1]], i) for x, i in zip(records, ids)]
+    for chunk in data:
+        chunk['classes'].append('freq')
+        chunk['classes'].append('sometimes')
+
+    if args.fuzzy is not None:
+        for k in sorted(sim.keys()):
+            print('fuzzy {}: {} merges'.format(' '.join(k), sim[k].fuzzy(args.fuzzy)))
+        print()
 
     for k in sorted(sim.keys()):
         sim[k].cluster()
@@ -99,20 +538,25 @@ def main():
         sim[k].dump()
         print()
 
+    clusters.save(STATE, keys)
+    with open('output/clusters.json', 'w') as f:
+        json.dump([sim[k].cluster_map(*k) for k in sorted(sim.keys())], f)
+    tables = [[], [], []]
+    for k in sorted(sim.keys()):
+        for table, rows in zip(tables, sim[k].index_rows(*k)):
+            table.extend(rows)
+    FreqIndex(FREQ).replace(*tables)
 
-    for chunk in data:
-        language = chunk['language']
-        textmap = { x: i for i,x in enumerate(chunk['texts']) }
-        clmap = { x: i for i,x in enumerate(chunk['classes']) }
-        chunk['classes'].append('freq')
-        chunk['classes'].append('sometimes')
-        for row,cl,words,short in chunk['rows']:
-            funclex = cl[clmap['lex-funct']]
-            f, f0, f1 = sim[(language,funclex)].get_count(words)
-            cl.append(f)
-            cl.append('yes' if f1 > 0 else 'no')
+    for cl, s, i in pending:
+        f, f0, f1 = s.get_count(i)
+        cl.append(f)
+        cl.append('yes' if f1 > 0 else 'no')
 
     with open('output/extract2.json', 'w') as f:
         json.dump(data, f, sort_keys=True, indent=1)
+    with open('output/extract2.jsonl', 'w') as f:
+        for chunk in data:
+            write_jsonl(f, chunk)
+    write_npz('output/extract2.npz', data)
 
 main()
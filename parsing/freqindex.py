@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+import argparse
+import sqlite3
+
+FREQ = 'output/freq.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clusters (
+    language TEXT NOT NULL,
+    funclex TEXT NOT NULL,
+    cluster TEXT NOT NULL,
+    forms TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    abbr INTEGER NOT NULL,
+    plain INTEGER NOT NULL,
+    mark TEXT NOT NULL,
+    PRIMARY KEY (language, funclex, cluster)
+);
+CREATE INDEX IF NOT EXISTS clusters_rows ON clusters (language, funclex, rows);
+CREATE TABLE IF NOT EXISTS witnesses (
+    language TEXT NOT NULL,
+    funclex TEXT NOT NULL,
+    cluster TEXT NOT NULL,
+    witness TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    abbr INTEGER NOT NULL,
+    plain INTEGER NOT NULL,
+    PRIMARY KEY (language, funclex, cluster, witness)
+);
+CREATE INDEX IF NOT EXISTS witnesses_rows ON witnesses (witness, language, funclex, rows);
+CREATE TABLE IF NOT EXISTS forms (
+    language TEXT NOT NULL,
+    funclex TEXT NOT NULL,
+    form TEXT NOT NULL,
+    cluster TEXT NOT NULL,
+    PRIMARY KEY (form, language, funclex)
+);
+"""
+
+ORDER = {
+    'rows': 'rows',
+    'abbr': 'abbr',
+    'plain': 'plain',
+    'ratio': 'CAST(abbr AS REAL) / (abbr + plain)',
+}
+
+def mark(f0, f1):
+    if f1 == 0:
+        return '-'
+    elif f1 >= f0:
+        return '#'
+    else:
+        return '+'
+
+
+class FreqIndex:
+    # Frequencies of each cluster of spelling variants, in total and per
+    # witness: rows = aligned rows, abbr / plain = abbreviated /
+    # unabbreviated words.
+    def __init__(self, filename):
+        self.db = sqlite3.connect(filename)
+        self.db.executescript(SCHEMA)
+
+    def replace(self, clusters, witnesses, forms):
+        with self.db:
+            for table in ['clusters', 'witnesses', 'forms']:
+                self.db.execute('DELETE FROM ' + table)
+            self.db.executemany('INSERT INTO clusters VALUES (?, ?, ?, ?, ?, ?, ?, ?)', clusters)
+            self.db.executemany('INSERT INTO witnesses VALUES (?, ?, ?, ?, ?, ?, ?)', witnesses)
+            self.db.executemany('INSERT INTO forms VALUES (?, ?, ?, ?)', forms)
+
+    def where(self, language, funclex, low, high, column):
+        cond = []
+        values = []
+        for c, v in [('language', language), ('funclex', funclex)]:
+            if v is not None:
+                cond.append(c + ' = ?')
+                values.append(v)
+        if low is not None:
+            cond.append(column + ' >= ?')
+            values.append(low)
+        if high is not None:
+            cond.append(column + ' <= ?')
+            values.append(high)
+        return (' WHERE ' + ' AND '.join(cond) if len(cond) else ''), values
+
+    def clusters(self, language=None, funclex=None, by='rows', k=None, low=None, high=None):
+        where, values = self.where(language, funclex, low, high, ORDER[by])
+        sql = 'SELECT mark, rows, abbr, plain, language, funclex, forms FROM clusters' + where
+        sql += ' ORDER BY {} DESC, language, funclex, cluster'.format(ORDER[by])
+        if k is not None:
+            sql += ' LIMIT ?'
+            values.append(k)
+        return self.db.execute(sql, values).fetchall()
+
+    def witness(self, witness, language=None, funclex=None, by='rows', k=None, low=None, high=None):
+        where, values = self.where(language, funclex, low, high, ORDER[by])
+        where += (' AND ' if where else ' WHERE ') + 'witness = ?'
+        values.append(witness)
+        sql = 'SELECT rows, abbr, plain, language, funclex, cluster FROM witnesses' + where
+        sql += ' ORDER BY {} DESC, language, funclex, cluster'.format(ORDER[by])
+        if k is not None:
+            sql += ' LIMIT ?'
+            values.append(k)
+        return self.db.execute(sql, values).fetchall()
+
+    def form(self, form):
+        return self.db.execute(
+            'SELECT c.mark, c.rows, c.abbr, c.plain, c.language, c.funclex, c.forms FROM forms f JOIN clusters c'
+            ' ON f.language = c.language AND f.funclex = c.funclex AND f.cluster = c.cluster'
+            ' WHERE f.form = ? ORDER BY c.language, c.funclex', (form,)).fetchall()
+
+
+def show(rows):
+    for r in rows:
+        print('\t'.join(str(x) for x in r))
+
+def do_top(args):
+    index = FreqIndex(args.index)
+    if args.witness is None:
+        show(index.clusters(args.language, args.funclex, args.by, args.k, args.min, args.max))
+    else:
+        show(index.witness(args.witness, args.language, args.funclex, args.by, args.k, args.min, args.max))
+
+def do_form(args):
+    show(FreqIndex(args.index).form(args.form.lower()))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--index', default=FREQ)
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('top', help='clusters with the highest (or a range of) frequencies')
+    p.add_argument('--language')
+    p.add_argument('--funclex', metavar='CLASS')
+    p.add_argument('--witness', help='frequencies in this witness only')
+    p.add_argument('--by', choices=sorted(ORDER), default='rows')
+    p.add_argument('-k', type=int, default=20, help='number of clusters to show')
+    p.add_argument('--min', type=float, help='only clusters with at least this value of --by')
+    p.add_argument('--max', type=float, help='only clusters with at most this value of --by')
+    p.set_defaults(run=do_top)
+    p = sub.add_parser('form', help='the clusters that contain this form')
+    p.add_argument('form')
+    p.set_defaults(run=do_form)
+    args = parser.parse_args()
+    args.run(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+import json
+
+# The rows of extract.json / extract2.json as JSON Lines: one record per
+# aligned word, with the information about its chunk repeated in each.
+
+CHUNK_FIELDS = ['key', 'name', 'chapter', 'kind', 'language', 'texts']
+
+def word_records(chunk):
+    for row, cl, words, short in chunk['rows']:
+        record = { x: chunk[x] for x in CHUNK_FIELDS }
+        record['abbr'] = row
+        record['classes'] = dict(zip(chunk['classes'], cl))
+        record['words'] = words
+        record['short'] = short
+        yield record
+
+def write_jsonl(f, chunk):
+    for record in word_records(chunk):
+        f.write(json.dumps(record, sort_keys=True, ensure_ascii=False))
+        f.write('\n')
+
+def read_jsonl(filename):
+    with open(filename) as f:
+        for line in f:
+            yield json.loads(line)
@@ -0,0 +1,101 @@
+import collections
+import numpy as np
+from common import CLLABELS
+
+CLASS_VALUES = [
+    ['func', 'lex', 'lex???', 'yes', 'no', ''],
+    ['yes', 'no', ''],
+    ['yes', 'no', ''],
+    ['yes', 'no', ''],
+]
+
+Violation = collections.namedtuple('Violation', 'sheet row message')
+
+def fix_class(s):
+    s = s.lower().strip()
+    if s in ['ye', 'yes¨']:
+        s = 'yes'
+    return s
+
+def column(a, c):
+    if c < a.shape[1]:
+        return a[:,c]
+    return np.full(a.shape[0], '', dtype=object)
+
+def check_sheet(name, table, labels, nwords):
+    # Checks every invariant that extract.py relies on, for all rows at
+    # once, and returns all violations (rows are numbered as in Excel).
+    n = len(labels)
+    result = []
+
+    def report(rows, message):
+        for r in np.atleast_1d(rows):
+            result.append(Violation(name, int(r) + 2, message))
+
+    if len(table) == 0:
+        return [Violation(name, 1, 'empty sheet')]
+    head = table[0]
+    cscore = 2*n
+    cfix = cscore + 1
+    ccl = cfix + 1
+    ncl = len(CLLABELS)
+    if head[0:2*n:2] != ['#'] * n or head[1:2*n:2] != labels:
+        return [Violation(name, 1, 'expected witnesses {}, got {}'.format(labels, head[1:2*n:2]))]
+    if head[ccl:ccl+ncl] != CLLABELS:
+        return [Violation(name, 1, 'expected classes {}, got {}'.format(CLLABELS, head[ccl:ccl+ncl]))]
+
+    width = max(len(values) for values in table)
+    a = np.array([values + [''] * (width - len(values)) for values in table[1:]], dtype=object).reshape(-1, width)
+    # The type of each cell, looked up once; the checks below are array
+    # operations on these masks.
+    types = np.frompyfunc(type, 1, 1)(a)
+    string = types == str
+    number = (types == int) | (types == float)
+
+    score = column(a, cscore)
+    fix = column(a, cfix)
+    has_score = score != ''
+    fix_empty = fix == ''
+    fix1 = ~fix_empty & (fix == 1)
+    fix0 = ~fix_empty & (fix == 0)
+    report(np.flatnonzero(~fix_empty & ~fix0 & ~fix1), 'fix must be 0, 1 or empty')
+    report(np.flatnonzero(fix1 & has_score), 'fix 1 on a row that has a score')
+    report(np.flatnonzero(fix0 & ~has_score), 'fix 0 on a row without a score')
+    good = fix1 | (fix_empty & has_score)
+
+    idx = a[:, 0:2*n:2]
+    present = idx != ''
+    numeric = number[:, 0:2*n:2]
+    report(np.flatnonzero(np.any(present & ~numeric, axis=1)), 'word index is not a number')
+    values = np.where(present & numeric, idx, -1).astype(float)
+    report(np.flatnonzero(np.any(present & (values != np.round(values)), axis=1)), 'word index is not an integer')
+    report(np.flatnonzero(good & ~np.all(present, axis=1)), 'aligned row with a missing word')
+    for j in range(n):
+        rows = np.flatnonzero(present[:,j])
+        v = values[rows, j]
+        expected = np.arange(len(v))
+        breaks = np.flatnonzero(v != expected)
+        if len(breaks):
+            # Only report where the numbering goes wrong, not every later row.
+            first = breaks[np.concatenate([[True], np.diff(v[breaks] - expected[breaks]) != 0])]
+            for k in first:
+                report(rows[k], '{}: word {} expected, got {:.0f}'.format(labels[j], k, v[k]))
+        if len(v) != nwords[j]:
+            result.append(Violation(name, len(table), '{}: {} words in the sheet, {} in the text'.format(labels[j], len(v), nwords[j])))
+
+    if a.shape[1] >= ccl+ncl:
+        cl = a[:, ccl:ccl+ncl]
+        text = string[:, ccl:ccl+ncl]
+    else:
+        cl = np.full((a.shape[0], ncl), '', dtype=object)
+        text = np.ones(cl.shape, dtype=bool)
+    report(np.flatnonzero(np.any(~text, axis=1)), 'class label is not text')
+    # Only the few distinct labels go through fix_class.
+    vocab, inverse = np.unique(np.where(text, cl, '').astype(str), return_inverse=True)
+    fixed = np.array([fix_class(x) for x in vocab], dtype=str)[inverse].reshape(cl.shape)
+    for i, allowed in enumerate(CLASS_VALUES):
+        bad = ~np.isin(fixed[:,i], allowed)
+        for r in np.flatnonzero(bad):
+            report(r, '{} = "{}"'.format(CLLABELS[i], fixed[r,i]))
+    result.sort(key=lambda x: x.row)
+    return result
@@ -1,7 +1,6 @@
 #!/usr/bin/env pypy3
 
 from collections import Counter, defaultdict
-import itertools
 import json
 import random
 import statistics
@@ -103,14 +102,44 @@ class Data:
             p = vv
         return sum(x ** 2 for x in tt)
 
+    def col_dist(self):
+        # The terms of eval_col_perm: ends[i] is the cost of starting or
+        # ending the path at column i, dist[i][j] the cost of i next to j.
+        m = len(self.texts)
+        ends = [ sum(c * abs(vv[i]) for vv,c in self.rows) for i in range(m) ]
+        dist = [ [ sum(c * abs(vv[i] - vv[j]) for vv,c in self.rows) for j in range(m) ] for i in range(m) ]
+        return ends, dist
+
     def opt_col_perm(self):
-        perm = None
-        value = None
-        for p in itertools.permutations(range(len(self.texts))):
-            v = self.eval_col_perm(p)
-            if value is None or v < value:
-                perm, value = p, v
-        self.colp = perm
+        # Held-Karp: cost[s][j] is the cost of visiting the columns in
+        # the set s after column j, and then ending the path. This is
+        # the same optimum as trying all permutations, in time
+        # O(2^m m^2) instead of O(m! m).
+        m = len(self.texts)
+        ends, dist = self.col_dist()
+        cost = [ ends ]
+        for s in range(1, 1 << m):
+            ks = [ k for k in range(m) if s >> k & 1 ]
+            row = [ infty for j in range(m) ]
+            for j in range(m):
+                if not s >> j & 1:
+                    d = dist[j]
+                    row[j] = min(d[k] + cost[s ^ (1 << k)][k] for k in ks)
+            cost.append(row)
+        # Among the optimal permutations, pick the first one in the
+        # lexicographic order, as itertools.permutations would.
+        perm = []
+        s = (1 << m) - 1
+        while s:
+            value = None
+            for k in range(m):
+                if s >> k & 1:
+                    v = (ends[k] if len(perm) == 0 else dist[perm[-1]][k]) + cost[s ^ (1 << k)][k]
+                    if value is None or v < value:
+                        best, value = k, v
+            perm.append(best)
+            s ^= 1 << best
+        self.colp = tuple(perm)
         for x in self.colp:
             print(self.texts[x])
 